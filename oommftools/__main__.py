@@ -1,3 +1,6 @@
+import multiprocessing
 import oommftools
 
-oommftools.main()
\ No newline at end of file
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    oommftools.main()
@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from . import oommfdecode
+
+
+class DecodeCache(object):
+    """
+    On-disk cache of decoded OVF files.
+
+    Each decode is stored in cacheDir as a .npy array plus a .json record of
+    the headers and extra captures, keyed by the source path, size, mtime and
+    decode options. Options are normalized first, so the same decode is
+    stored once however it was asked for: a dtype in any spelling (or
+    "native") shares one entry, and mmap only changes how a hit is
+    returned. A changed source file simply misses the cache. When
+    maxBytes is set, the least recently used entries are evicted to keep the
+    cache under it.
+    """
+    def __init__(self, cacheDir, maxBytes=None):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    def unpackFile(self, filename, **options):
+        """
+        Drop-in replacement for oommfdecode.unpackFile that consults the cache.
+
+        With mmap=True the entry is returned as a read-only memory-mapped
+        array, decoding it into the cache first on a miss.
+        """
+        out = options.pop("out", None)
+        mmap = options.pop("mmap", False)
+        key = self.key(filename, options)
+        hit = self._load(key, mmap=mmap)
+        if hit is None:
+            array, headers, extra = oommfdecode.unpackFile(filename, **options)
+            self._store(key, filename, options, np.asarray(array), headers, extra)
+            if mmap and out is None:
+                #Serve the freshly stored entry mapped, as a later hit would be
+                hit = self._load(key, mmap=True)
+                if hit is not None:
+                    array = hit[0]
+        else:
+            print("Cache hit:", filename)
+            array, headers, extra = hit
+        if out is not None:
+            out[...] = array
+            array = out
+        return (array, headers, extra)
+
+    def key(self, filename, options):
+        """
+        Cache key for a file in its current state, decoded with options.
+        """
+        stat = os.stat(filename)
+        ident = repr((os.path.abspath(filename), stat.st_size, stat.st_mtime,
+                      self._keyOptions(filename, options)))
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def _keyOptions(self, filename, options):
+        """
+        The decode options that change the result, in one canonical form:
+        the resolved dtype string and the selection index. mmap and out
+        only change how the result is delivered, so they are left out.
+        """
+        dtype = options.get("dtype", np.float64)
+        if isinstance(dtype, str) and dtype == "native":
+            dtype = oommfdecode._resolveDtype(dtype, oommfdecode.scanHeaders(filename)["DataFormat"])
+        return (np.dtype(dtype).str,
+                repr(oommfdecode._selection(options.get("roi"), options.get("components"))))
+
+    def size(self):
+        """
+        Total bytes held by the cache.
+        """
+        return sum(os.path.getsize(path) for path in self._paths())
+
+    def clear(self):
+        """
+        Remove every cache entry.
+        """
+        for path in self._paths():
+            os.remove(path)
+
+    def validate(self):
+        """
+        Drop entries that are unreadable or whose source file has changed.
+
+        Returns the number of entries removed.
+        """
+        removed = 0
+        for key in self._keys():
+            try:
+                with open(self._record(key)) as f:
+                    record = json.load(f)
+                stat = os.stat(record["source"])
+                valid = (stat.st_size == record["size"]
+                         and stat.st_mtime == record["mtime"]
+                         and os.path.exists(self._array(key)))
+            except (IOError, OSError, ValueError, KeyError):
+                valid = False
+            if not valid:
+                self._remove(key)
+                removed += 1
+        return removed
+
+    def _load(self, key, mmap=False):
+        try:
+            with open(self._record(key)) as f:
+                record = json.load(f)
+            array = np.load(self._array(key), mmap_mode="r" if mmap else None)
+        except (IOError, OSError, ValueError):
+            return None
+        #Touch the record so eviction sees this entry as recently used
+        os.utime(self._record(key), None)
+        return (array, record["headers"], record["extra"])
+
+    def _store(self, key, filename, options, array, headers, extra):
+        stat = os.stat(filename)
+        record = {"source": os.path.abspath(filename),
+                  "size": stat.st_size,
+                  "mtime": stat.st_mtime,
+                  "options": repr(self._keyOptions(filename, options)),
+                  "headers": headers,
+                  "extra": extra}
+        handle, temp = tempfile.mkstemp(suffix=".npy", dir=self.cacheDir)
+        with os.fdopen(handle, "wb") as f:
+            np.save(f, array)
+        #os.replace, unlike os.rename, overwrites on Windows too (say, a
+        #concurrent miss on the same file storing its array first)
+        os.replace(temp, self._array(key))
+        with open(self._record(key), "w") as f:
+            json.dump(record, f)
+        self._evict()
+
+    def _evict(self):
+        if self.maxBytes is None:
+            return
+        entries = []
+        for key in self._keys():
+            try:
+                used = os.path.getmtime(self._record(key))
+                size = os.path.getsize(self._record(key)) + os.path.getsize(self._array(key))
+            except OSError:
+                continue
+            entries.append((used, size, key))
+        total = sum(size for used, size, key in entries)
+        for used, size, key in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def _remove(self, key):
+        for path in (self._array(key), self._record(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                #Already removed, by another thread evicting at the same time
+                pass
+
+    def _keys(self):
+        return [name[:-5] for name in os.listdir(self.cacheDir) if name.endswith(".json")]
+
+    def _paths(self):
+        return [os.path.join(self.cacheDir, name) for name in os.listdir(self.cacheDir)
+                if name.endswith(".npy") or name.endswith(".json")]
+
+    def _array(self, key):
+        return os.path.join(self.cacheDir, key + ".npy")
+
+    def _record(self, key):
+        return os.path.join(self.cacheDir, key + ".json")
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import numpy as np
+from . import oommfdecode
+
+try:
+    import xarray
+except ImportError:
+    xarray = None
+
+#Dimension names of a collection, in index order
+DIMS = ("time", "x", "y", "z", "component")
+
+
+class FrameCollection(object):
+    """
+    A run of OVF files opened as one lazy (time, x, y, z, component) array.
+
+    Opening only reads the first file's header; each frame is decoded when
+    it is first indexed and the most recently used maxFrames frames are kept
+    in memory. Integer, slice and list indices pick frames, and any further
+    indices are applied within them, so run[10, :, :, 0] decodes only frame
+    10. Cached frames are read-only, so indexing returns views that can't
+    change what later reads see; copy them to modify. All files must share
+    the same grid. dtype is as for
+    oommfdecode.unpackFile, and files are decoded through cache (a
+    decodecache.DecodeCache) when one is given.
+
+    Coordinates come from the headers: cell centres from xbase/xstepsize and
+    so on, and SimTime, Iteration and Stage per frame, scanned from every
+    header the first time they are asked for.
+    """
+    def __init__(self, targetList, maxFrames=16, dtype=np.float64, cache=None):
+        self.targets = list(targetList)
+        if not self.targets:
+            raise Exception("A frame collection needs at least one file")
+        self.fields = oommfdecode.scanHeaders(self.targets[0])
+        self.dtype = oommfdecode._resolveDtype(dtype, self.fields["DataFormat"])
+        self.shape = (len(self.targets),) + oommfdecode._gridShape(self.fields)
+        self.ndim = len(self.shape)
+        self.maxFrames = maxFrames
+        self.cache = cache
+        self.frames = OrderedDict()
+        self._captures = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frame(i)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        index, rest = key[0], key[1:]
+        if isinstance(index, (int, np.integer)):
+            return self.frame(index)[rest]
+        indices = np.arange(len(self))[index]
+        out = None
+        for n, i in enumerate(indices):
+            part = self.frame(i)[rest]
+            if out is None:
+                out = np.empty((len(indices),) + part.shape, dtype=self.dtype)
+            out[n] = part
+        if out is None:
+            out = np.empty((0,) + self.shape[1:], dtype=self.dtype)[(slice(None),) + rest]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
+
+    def frame(self, index):
+        """
+        Decoded, read-only (x, y, z, component) array of one frame, through the LRU.
+        """
+        index = range(len(self))[index]
+        if index in self.frames:
+            self.frames.move_to_end(index)
+            return self.frames[index]
+        unpack = self.cache.unpackFile if self.cache else oommfdecode.unpackFile
+        array = unpack(self.targets[index], dtype=self.dtype)[0]
+        array.flags.writeable = False
+        self.frames[index] = array
+        while len(self.frames) > self.maxFrames:
+            self.frames.popitem(last=False)
+        return array
+
+    def coords(self):
+        """
+        Dictionary of coordinate arrays for each dimension, plus the
+        Iteration and Stage of each frame.
+        """
+        coords = {"time": self.captures("SimTime"),
+                  "Iteration": self.captures("Iteration"),
+                  "Stage": self.captures("Stage"),
+                  "component": np.arange(self.shape[-1])}
+        for axis, nodes in zip("xyz", self.shape[1:4]):
+            coords[axis] = (float(self.fields[axis + "base"])
+                            + float(self.fields[axis + "stepsize"]) * np.arange(nodes))
+        if self.shape[-1] == 3:
+            coords["component"] = np.array(["x", "y", "z"])
+        return coords
+
+    def captures(self, key):
+        """
+        Per-frame array of an extra capture (SimTime, Iteration, Stage or
+        MIFSource), read from the headers alone.
+        """
+        if self._captures is None:
+            scanned = [oommfdecode.scanHeaders(target) for target in self.targets]
+            self._captures = dict((name, np.array([fields[name] for fields in scanned]))
+                                  for name in ("SimTime", "Iteration", "Stage", "MIFSource"))
+        return self._captures[key]
+
+    def toXarray(self, name="OOMMFData"):
+        """
+        Decode the whole run into an xarray.Dataset with coordinates.
+
+        Needs the xarray package.
+        """
+        if xarray is None:
+            raise ImportError("xarray export needs the xarray package")
+        coords = self.coords()
+        attrs = dict((key, value) for key, value in list(self.fields.items())
+                     if isinstance(value, (str, float)) and not key in
+                     ("SimTime", "Iteration", "Stage", "MIFSource", "DataFormat", "DataOffset"))
+        data = oommfdecode.groupUnpack(self.targets, dtype=self.dtype, cache=self.cache)[0]
+        return xarray.Dataset({name: (DIMS, data)},
+                              coords={"time": coords["time"],
+                                      "x": coords["x"],
+                                      "y": coords["y"],
+                                      "z": coords["z"],
+                                      "component": coords["component"],
+                                      "Iteration": ("time", coords["Iteration"]),
+                                      "Stage": ("time", coords["Stage"])},
+                              attrs=attrs)
@@ -0,0 +1,253 @@
+import time
+import struct
+import numpy as np
+from . import oommfdecode
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+#Chunk layouts for the frame stack: a whole frame, or one z-slab of a frame
+CHUNKINGS = ("frame", "slab")
+
+#MATLAB v7.3 files are HDF5 files behind a 512 byte MAT-file header
+MATLAB_USERBLOCK = 512
+
+#MATLAB_class attribute for each numpy dtype MATLAB can read back
+MATLAB_CLASSES = {np.dtype(np.float64): "double",
+                  np.dtype(np.float32): "single"}
+
+
+class _FrameStack(object):
+    """
+    Shared context handling of the incremental frame stack writers.
+    """
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class HDF5Stack(_FrameStack):
+    """
+    Frame stack written incrementally to an HDF5 file.
+
+    The frames go into a chunked (nframes, x, y, z, ncomponents) dataset
+    named OOMMFData, compressed with compression ("gzip", "lzf" or None).
+    Each chunk holds one frame, or one z-slab of a frame with
+    chunking="slab". The per-frame extra captures (SimTime, Iteration,
+    Stage, MIFSource) are kept as aligned 1-D datasets and the grid headers
+    as attributes of the file. Only the frame being written is held in
+    memory.
+    """
+    def __init__(self, filename, nframes, frameShape, headers, dtype=np.float64,
+                 compression="gzip", chunking="frame"):
+        if h5py is None:
+            raise ImportError("HDF5 export needs the h5py package")
+        if chunking not in CHUNKINGS:
+            raise Exception("Unknown chunking %r, expected one of %r" % (chunking, CHUNKINGS))
+        chunks = (1,) + tuple(frameShape)
+        if chunking == "slab":
+            chunks = chunks[:3] + (1,) + chunks[4:]
+        self.nframes = nframes
+        self.file = h5py.File(filename, "w")
+        self.data = self.file.create_dataset("OOMMFData", (nframes,) + tuple(frameShape),
+                                             dtype=dtype, chunks=chunks,
+                                             compression=compression,
+                                             shuffle=compression is not None)
+        for key, value in list(headers.items()):
+            self.file.attrs[key] = value
+        self.extra = {}
+
+    def write(self, index, frame, extra):
+        """
+        Store one decoded frame and its extra captures at index.
+        """
+        self.data[index] = frame
+        for key, value in list(extra.items()):
+            if key not in self.extra:
+                if isinstance(value, str):
+                    self.extra[key] = self.file.create_dataset(key, (self.nframes,),
+                                                               dtype=h5py.string_dtype())
+                else:
+                    self.extra[key] = self.file.create_dataset(key, (self.nframes,),
+                                                               dtype=np.float64, fillvalue=-1)
+            self.extra[key][index] = value
+
+
+def hdf5Array(array, headers, extraData, filename, dtype=None, compression="gzip",
+              chunking="frame"):
+    """
+    Save a decoded frame stack and its extra data to an HDF5 file.
+
+    array is a groupUnpack stack with extraData holding one entry per frame,
+    or a single unpackFile frame with its extra captures. The array keeps
+    its own precision unless dtype is given.
+    """
+    _writeArray(HDF5Stack, array, headers, extraData, filename, dtype,
+                compression=compression, chunking=chunking)
+
+
+def hdf5Files(targetList, filename, dtype=np.float64, compression="gzip", chunking="frame",
+              progress=None, cache=None, roi=None, components=None):
+    """
+    Decode OVF files straight into an HDF5 file, one frame at a time.
+
+    The stack is never held in memory, so this scales to runs larger than
+    RAM. All files must share the same grid. dtype, roi and components are
+    as for oommfdecode.unpackFile, and progress and cache as for
+    oommfdecode.groupUnpack.
+    """
+    _writeFiles(HDF5Stack, targetList, filename, dtype, progress, cache, roi, components,
+                compression=compression, chunking=chunking)
+
+
+def _writeArray(stackClass, array, headers, extraData, filename, dtype, **options):
+    """
+    Write a decoded stack (or a single frame) through a stackClass writer.
+    """
+    array = np.asarray(array)
+    if array.ndim == 4:
+        array = array[np.newaxis]
+        extraData = dict((key, [value]) for key, value in list(extraData.items()))
+    with stackClass(filename, len(array), array.shape[1:], headers, dtype or array.dtype,
+                    **options) as stack:
+        for i, frame in enumerate(array):
+            stack.write(i, frame, dict((key, values[i]) for key, values in list(extraData.items())))
+
+
+def _writeFiles(stackClass, targetList, filename, dtype, progress, cache, roi, components,
+                **options):
+    """
+    Decode OVF files one at a time straight into a stackClass writer.
+    """
+    stack = None
+    try:
+        frames = oommfdecode.iterUnpack(targetList, reuseBuffer=True, cache=cache, dtype=dtype,
+                                        roi=roi, components=components)
+        for i, (frame, headers, extra) in enumerate(frames):
+            if stack is None:
+                stack = stackClass(filename, len(targetList), frame.shape, headers, frame.dtype,
+                                   **options)
+            stack.write(i, frame, extra)
+            if progress:
+                progress(i, targetList[i])
+    finally:
+        if stack is not None:
+            stack.close()
+
+
+class MATLABStack(_FrameStack):
+    """
+    Frame stack written incrementally to a MATLAB v7.3 (HDF5 based) file.
+
+    The variables match matlabifyArray - OOMMFData, GridSize and the extra
+    captures - so existing MATLAB scripts load either file unchanged, but
+    frames are written one at a time into a chunked dataset and there is no
+    MAT v5 size limit. MATLAB is column-major, so every variable is stored
+    transposed.
+    """
+    def __init__(self, filename, nframes, frameShape, headers, dtype=np.float64,
+                 compression="gzip"):
+        if h5py is None:
+            raise ImportError("MATLAB v7.3 export needs the h5py package")
+        dtype = np.dtype(dtype)
+        if dtype not in MATLAB_CLASSES:
+            raise Exception("Can't store %s data for MATLAB" % dtype)
+        self.filename = filename
+        self.nframes = nframes
+        self.extra = {}
+        self.file = h5py.File(filename, "w", userblock_size=MATLAB_USERBLOCK)
+        shape = (nframes,) + tuple(frameShape)
+        self.data = self.file.create_dataset("OOMMFData", shape[::-1], dtype=dtype,
+                                             chunks=shape[:0:-1] + (1,),
+                                             compression=compression)
+        _matlabClass(self.data, MATLAB_CLASSES[dtype])
+        _matlabVariable(self.file, "GridSize", [float(headers["xstepsize"]),
+                                                float(headers["ystepsize"]),
+                                                float(headers["zstepsize"])])
+
+    def write(self, index, frame, extra):
+        """
+        As HDF5Stack.write, with the frame stored transposed.
+        """
+        self.data[..., index] = np.asarray(frame).T
+        for key, value in list(extra.items()):
+            self.extra.setdefault(key, [None] * self.nframes)[index] = value
+
+    def close(self):
+        #The extra captures are tiny; they are written whole once every frame is in
+        for key, values in list(self.extra.items()):
+            _matlabVariable(self.file, key, values)
+        _FrameStack.close(self)
+        _writeMATLABHeader(self.filename)
+
+
+def _matlabClass(dataset, matlabClass):
+    dataset.attrs.create("MATLAB_class", np.bytes_(matlabClass))
+
+def _matlabVariable(group, name, values):
+    """
+    Store a list of numbers or strings as a MATLAB row vector or char matrix,
+    laid out as scipy.io.savemat would.
+    """
+    if any(isinstance(value, str) for value in values):
+        width = max(len(value) for value in values)
+        if width == 0:
+            _matlabEmpty(group, name, (len(values), 0), "char")
+            return
+        chars = np.array([[ord(c) for c in value.ljust(width)] for value in values],
+                         dtype=np.uint16).reshape(len(values), width)
+        dataset = group.create_dataset(name, data=chars.T)
+        _matlabClass(dataset, "char")
+        dataset.attrs.create("MATLAB_int_decode", np.int32(2))
+    elif not values:
+        _matlabEmpty(group, name, (1, 0), "double")
+    else:
+        dataset = group.create_dataset(name, data=np.array([values], dtype=np.float64).T)
+        _matlabClass(dataset, "double")
+
+def _matlabEmpty(group, name, dims, matlabClass):
+    """
+    Store an empty MATLAB array the way MATLAB does: its dimensions as
+    uint64 data, flagged with MATLAB_empty.
+    """
+    dataset = group.create_dataset(name, data=np.array(dims, dtype=np.uint64))
+    _matlabClass(dataset, matlabClass)
+    dataset.attrs.create("MATLAB_empty", np.uint8(1))
+
+def _writeMATLABHeader(filename):
+    """
+    Fill the HDF5 userblock with the MAT-file header MATLAB looks for.
+    """
+    text = "MATLAB 7.3 MAT-file, Platform: GLNXA64, Created on: %s HDF5 schema 1.00 ." \
+           % time.strftime("%a %b %d %H:%M:%S %Y")
+    header = text.ljust(116).encode("ascii") + b" " * 8 + struct.pack("<H", 0x0200) + b"IM"
+    with open(filename, "r+b") as f:
+        f.write(header)
+
+
+def matlab73Array(array, headers, extraData, filename, dtype=None, compression="gzip"):
+    """
+    Save a decoded stack as a MATLAB v7.3 file, one frame at a time.
+
+    Takes the same arguments as hdf5Array and writes the same variables as
+    oommfdecode.matlabifyArray, without the MAT v5 size limits.
+    """
+    _writeArray(MATLABStack, array, headers, extraData, filename, dtype, compression=compression)
+
+
+def matlab73Files(targetList, filename, dtype=np.float64, compression="gzip", progress=None,
+                  cache=None, roi=None, components=None):
+    """
+    Decode OVF files straight into a MATLAB v7.3 file, one frame at a time.
+
+    Arguments are as for hdf5Files.
+    """
+    _writeFiles(MATLABStack, targetList, filename, dtype, progress, cache, roi, components,
+                compression=compression)
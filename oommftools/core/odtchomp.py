@@ -1,7 +1,11 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
-
+import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from functools import partial
+from itertools import chain
 import numpy as np
 
 ########
@@ -13,12 +17,110 @@ ALWAYS_CLEAR = ["Oxs_"]
 
 PROTECTED_NAMES = ["Exchange"]
 
-def write(filename, interpreter, delim, fields):
+#Bytes of an ODT file read and parsed at a time
+CHUNK_BYTES = 1 << 20
+
+#Rows formatted and written out in one go by the writers
+WRITE_ROWS = 1 << 16
+
+def write(filename, interpreter, delim, fields, fmt="%s"):
     """
+    Write the fields columns of interpreter out as a delimited file.
+
+    Every value is formatted with fmt ("%s" gives the shortest repr of each
+    value); all rows are written.
     """
     print("Write out to:", filename)
+    with open(filename, "w", buffering=CHUNK_BYTES) as f:
+        delim = _writeHeader(f, delim, fields)
+        _writeRows(f, [interpreter.getData()[key] for key in fields], delim, fmt)
+
+def convert(odt, filename, delim, fields, parent=None, fmt="%s"):
+    """
+    Stream the fields columns of an ODT file straight into a delimited file.
+
+    Column names are resolved from a header-only pass, then the table is
+    parsed chunk by chunk and each block is written as soon as it is
+    parsed, so memory use doesn't grow with the number of rows. Rows of a
+    table that lacks one of the fields get nan in its place. fmt is as for
+    write.
+    """
+    wanted = _resolveColumns(odt, fields)
+    rawNames = dict((pretty, raw) for raw, pretty in list(wanted.items()))
+    print("Write out to:", filename)
+    with open(filename, "w", buffering=CHUNK_BYTES) as f:
+        outdelim = _writeHeader(f, delim, fields)
+        for headers, block in iterBlocks(odt, parent, wanted=wanted):
+            if not block:
+                continue
+            length = len(next(iter(block.values())))
+            _writeRows(f, [block.get(rawNames[field], np.full(length, np.nan)) for field in fields],
+                       outdelim, fmt)
+
+def batchConvert(targetList, delim, fields, workers=1, useProcesses=False, outputDir=None,
+                 progress=None, fmt="%s"):
+    """
+    Convert many ODT files with one column selection and delimiter.
+
+    Each file is streamed through convert into a .txt file of the same name,
+    next to it or in outputDir. With workers > 1 the files are spread over a
+    thread pool or, with useProcesses=True, a process pool; parsing holds
+    the GIL, so only processes scale with core count (a frozen app must
+    call multiprocessing.freeze_support() first). A file that fails (say,
+    because it lacks one of the fields) doesn't stop the others: progress, if given, is called as
+    progress(index, filename, error) in the calling process as each file
+    finishes, with error None on success. Returns a dictionary of the error
+    message of every failed file.
+    """
+    convertOne = partial(_convertIndexed, delim=delim, fields=fields, outputDir=outputDir,
+                         fmt=fmt)
+    if workers > 1 and len(targetList) > 1:
+        if useProcesses:
+            pool = multiprocessing.Pool(min(workers, len(targetList)))
+        else:
+            pool = ThreadPool(min(workers, len(targetList)))
+        jobs = pool.imap_unordered(convertOne, enumerate(targetList))
+    else:
+        pool = None
+        jobs = (convertOne(job) for job in enumerate(targetList))
+    errors = {}
+    try:
+        for i, error in jobs:
+            if error is not None:
+                log("Couldn't convert %s: %s" % (targetList[i], error))
+                errors[targetList[i]] = error
+            if progress:
+                progress(i, targetList[i], error)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    return errors
+
+def batchOutputName(odt, outputDir=None):
+    """
+    The .txt file batchConvert writes odt out to.
+    """
+    outfname = os.path.basename(odt).split(".")[0] + ".txt"
+    return os.path.join(outputDir or os.path.dirname(odt), outfname)
+
+def _convertIndexed(job, delim, fields, outputDir, fmt):
+    """
+    Pool worker for batchConvert: convert job = (index, filename) and
+    return (index, error message or None).
+    """
+    i, odt = job
+    try:
+        convert(odt, batchOutputName(odt, outputDir), delim, fields, fmt=fmt)
+    except Exception as e:
+        return (i, str(e) or repr(e))
+    return (i, None)
+
+def _writeHeader(f, delim, fields):
+    """
+    Write the field names line and return the delimiter to use for values.
+    """
     refdelim = delim
-    f = open(filename, "w")
     #Do keys
     if delim == ",":
         delim = ", "
@@ -30,22 +132,25 @@ def write(filename, interpreter, delim, fields):
     else:
         reffields = fields
 
-
     line = delim.join(reffields) + "\n"
     f.write(line)
-    #Do values
-    i = 0
-    while i < interpreter.getDataLength()-1:
-        line = ""
-        for key in fields:
-            line += str(interpreter.getData()[key][i]) + delim
-        line = line.rstrip(delim)
-        line += "\n"
-        f.write(line)
-        i += 1
-
-    #Cleanup
-    f.close()
+    return delim
+
+def _writeRows(f, columns, delim, fmt="%s"):
+    """
+    Write equal-length columns out as delimited rows.
+
+    Rows are formatted WRITE_ROWS at a time with a single % over a repeated
+    row template, savetxt style, and each batch goes out in one write.
+    """
+    if not columns:
+        return
+    row = delim.replace("%", "%%").join([fmt] * len(columns)) + "\n"
+    length = min(len(column) for column in columns)
+    for start in range(0, length, WRITE_ROWS):
+        stop = min(start + WRITE_ROWS, length)
+        values = [np.asarray(column[start:stop]).tolist() for column in columns]
+        f.write((row * (stop - start)) % tuple(chain.from_iterable(zip(*values))))
 
 def resolve(lst, keys):
     """
@@ -77,71 +182,199 @@ def log(evt):
     print(evt)
 
 
-def chomp(odt, parent=None):
+def chomp(odt, parent=None, columns=None):
     """
+    Parse an ODT file into an Interpreter of prettified column arrays.
+
+    The file is streamed through iterBlocks, so parsing is linear in the file
+    size. Every "# Columns:" line starts a new block with its own column
+    order; columns seen in earlier blocks keep accumulating.
+
+    columns optionally lists the prettified names to keep. They are
+    resolved against the headers before any data is read, only those
+    columns are converted, and the Interpreter holds just them, in the
+    order given.
     """
     retHeaders = []
     retDict = {}
     log("Opening %s" % odt)
-    f = open(odt, "r")
-    data = f.readlines()
-    log("File length: %d lines." % len(data))
+    wanted = None
+    if columns is not None:
+        wanted = _resolveColumns(odt, columns)
+    for retHeaders, block in iterBlocks(odt, parent, wanted=wanted):
+        if wanted is not None:
+            retHeaders = [grab for grab in retHeaders if grab in wanted]
+        for grab in retHeaders:
+            if not grab in retDict:
+                log("Identifying new header: %s" % grab)
+                retDict[grab] = []
+        for key, values in list(block.items()):
+            retDict[key].append(values)
+    for key in retDict:
+        retDict[key] = np.concatenate(retDict[key]) if retDict[key] else np.array([])
+    if wanted is not None:
+        return Interpreter(dict((wanted[key], retDict[key]) for key in retDict), list(columns))
+    return Interpreter(headers_prettify(retDict), list_prettify(retHeaders))
+
+def _resolveColumns(odt, columns):
+    """
+    Map the raw names of the prettified columns wanted to their pretty names.
+    """
+    pretty = prettyNames(scanColumns(odt))
+    wanted = dict((raw, name) for raw, name in list(pretty.items()) if name in columns)
+    missing = [name for name in columns if not name in list(wanted.values())]
+    if missing:
+        raise Exception("No such columns in %s: %s" % (odt, ", ".join(missing)))
+    return wanted
+
+def iterBlocks(odt, parent=None, chunkBytes=CHUNK_BYTES, wanted=None):
+    """
+    Stream an ODT file as (headers, block) pairs.
+
+    headers is the raw column list of the current table and block a
+    dictionary of raw column name to the float array of values parsed since
+    the last pair. The file is read chunkBytes at a time and each chunk's
+    data rows are converted in bulk, so memory use is bounded by the chunk
+    size however long the table is. A "# Columns:" line yields its new
+    headers with an empty block straight away. If wanted (a collection of
+    raw names) is given, only those columns are converted and returned.
+
+    If parent is given, parent.progstart(filesize) is called first and
+    parent.progreport(bytesRead) after every chunk.
+    """
+    headers = []
     InData = False
-    if parent:
-        parent.progstart(len(data))
-    for i, line in enumerate(data):
+    with open(odt, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        log("File length: %d bytes." % size)
         if parent:
-            parent.progreport(i)
+            parent.progstart(size)
+        tail = b""
+        while True:
+            chunk = f.read(chunkBytes)
+            data = tail + chunk
+            #Hold back a partial last line until the next chunk completes it
+            cut = data.rfind(b"\n") + 1 if chunk else len(data)
+            tail = data[cut:]
+            rows = []
+            for line in data[:cut].decode().splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                #Look out for multiple table headers in the parse!
+                if line[0] == "#":
+                    InData = False
+                    if rows:
+                        yield (headers, _absorbBlock(rows, headers, wanted))
+                        rows = []
+                    #Comment or table parse
+                    if "Columns" in line:
+                        log("Absorbing header data: Identifying coumns.")
+                        #Clobber header table
+                        headers = _parseColumns(line)
+                        yield (headers, {})
+                else:
+                    if not InData:
+                        log("Processing data block.")
+                        InData = True
+                    rows.append(line)
+            if rows:
+                yield (headers, _absorbBlock(rows, headers, wanted))
+            if parent:
+                parent.progreport(f.tell())
+            if not chunk:
+                break
+
+def scanColumns(odt):
+    """
+    Raw names of every column declared in an ODT file, in first-seen order,
+    without converting any data.
+    """
+    names = []
+    with open(odt, "rb") as f:
+        for line in f:
+            if line.lstrip().startswith(b"#") and b"Columns" in line:
+                for grab in _parseColumns(line.decode().strip()):
+                    if not grab in names:
+                        names.append(grab)
+    return names
+
+def prettyNames(rawNames):
+    """
+    Map each raw column name to its prettified name, as chomp names them.
+    """
+    uniquenessCheck = [name.split(":") for name in rawNames]
+    return dict((name, namepolish(name, uniquenessCheck)) for name in rawNames)
+
+def _parseColumns(line):
+    """
+    Column names from a "# Columns:" line, braced names kept whole.
+    """
+    headers = []
+    line = line.split("Columns:")[1].strip()
+    while line:
+        grab = ""
         line = line.strip()
-        #Look out for multiple table headers in the parse!
-        if line[0] == "#":
-            InData = False
-            #Comment or table parse
-            if "Columns" in line:
-                log("Absorbing header data: Identifying coumns.")
-                #Clobber header table
-                retHeaders = []
-                #Begin slow parse
-                line = line.split("Columns:")[1].strip()
-                while line:
-                    grab = ""
-                    line = line.strip()
-                    if line[0] == "{":
-                        #Group match!
-                        grab, line = line.split("}", 1)
-                        line = line.strip() #Must clear trailing spaces
-                        grab = grab.strip("{}")
-                        log("Matching title field by symbol: %s" % grab)
-                    else:
-                        #Spacesplit match
-                        print("In spacesplit match:")
-                        check = line.split(" ", 1)
-                        if len(check) == 1:
-                            grab = check[0]
-                            line = ""
-                        else:
-                            grab, line = check
-                        grab = grab.strip()
-                        log("Matching title field by space: %s" % grab)
-                    if grab:
-                        log("Indexing %s at point %d" % (grab, len(retHeaders)))
-                        retHeaders.append(grab)
-                        if not grab in retDict:
-                            log("Identifying new header: %s" % grab)
-                            retDict[grab] = np.array([])
-            else:
-                pass #Currently do nothing on other header lines
+        if line[0] == "{":
+            #Group match!
+            grab, line = line.split("}", 1)
+            line = line.strip() #Must clear trailing spaces
+            grab = grab.strip("{}")
+            log("Matching title field by symbol: %s" % grab)
         else:
-            if not InData:
-                log("Processing data block.")
-                InData = True
-            #Chew actual data
-            fields = split_densify(line)
-            for i, v in enumerate(fields):
-                fieldname = retHeaders[i]
-                retDict[fieldname] = np.append(retDict[fieldname], float(v))
-    f.close()
-    return Interpreter(headers_prettify(retDict), list_prettify(retHeaders))
+            #Spacesplit match
+            check = line.split(" ", 1)
+            if len(check) == 1:
+                grab = check[0]
+                line = ""
+            else:
+                grab, line = check
+            grab = grab.strip()
+            log("Matching title field by space: %s" % grab)
+        if grab:
+            log("Indexing %s at point %d" % (grab, len(headers)))
+            headers.append(grab)
+    return headers
+
+def _absorbBlock(rows, headers, wanted=None):
+    """
+    Convert a block of data rows into a dictionary of column arrays.
+
+    Only the columns named in wanted are converted (all of them if it is
+    None), and rows are only split as far as the last of those. Runs of
+    full rows are converted in one go; ragged rows (and every row, if a
+    column name repeats) are assigned value by value, in row order.
+    """
+    positions = [i for i, name in enumerate(headers) if wanted is None or name in wanted]
+    if not positions:
+        return {}
+    names = [headers[i] for i in positions]
+    columns = dict((name, []) for name in names)
+    last = positions[-1]
+    vectorize = len(set(names)) == len(names)
+    full = []
+    for row in rows:
+        fields = row.split(None, last + 1)
+        if vectorize and len(fields) > last and (wanted is not None or len(fields) == len(headers)):
+            full.append([fields[i] for i in positions])
+            continue
+        _absorbRows(full, names, columns)
+        full = []
+        for i, v in enumerate(fields[:last + 1]):
+            if wanted is None or headers[i] in wanted:
+                columns[headers[i]].append(np.array([float(v)]))
+    _absorbRows(full, names, columns)
+    return dict((name, np.concatenate(parts)) for name, parts in list(columns.items()) if parts)
+
+def _absorbRows(full, headers, columns):
+    """
+    Convert rows holding exactly one value per column in a single numpy call.
+    """
+    if not full:
+        return
+    block = np.array(full, dtype=float).reshape(len(full), len(headers))
+    for i, fieldname in enumerate(headers):
+        columns[fieldname].append(block[:, i])
 
 class Interpreter(object):
     """
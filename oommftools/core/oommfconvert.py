@@ -38,7 +38,9 @@ def spliceConfig(percentMagnitude, checkVectors=False, filenames=[], configPath=
         os.close(oshandle)
     except:
         print("Error: Windows failed all over closing the file handle.")
-    newMax = slowlyPainfullyMaximize(filenames)
+    newMax = None
+    if checkVectors:
+        newMax = slowlyPainfullyMaximize(filenames)
     newconf = replaceConfigLines(oldconflines, 
                                  newMax, 
                                  percentMagnitude,
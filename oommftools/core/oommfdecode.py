@@ -1,129 +1,739 @@
+import os
+import gzip
+import bz2
+import lzma
+import tarfile
+import zipfile
+import tempfile
 import numpy as np
 import struct
+import json
 import pickle
 import scipy.io as spio
 from collections import defaultdict
+from itertools import islice
+from contextlib import contextmanager
+from functools import partial
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
-def unpackFile(filename):
-    """
-    """
-    with open(filename, 'rb') as f:
-        headers = {} #I know valuemultiplier isn't always present. This is checked later.
-        extraCaptures = {'SimTime':-1, 'Iteration':-1, 'Stage':-1, "MIFSource":""}
-        #Parse headers
-        a = ""
-        while not "Begin: Data" in a:
-            
-            a = f.readline().strip().decode()
-            #Determine if it's actually something we need as header data
-            for key in ["xbase",
-                        "ybase",
-                        "zbase",
-                        "xstepsize",
-                        "ystepsize",
-                        "zstepsize",
-                        "xnodes",
-                        "ynodes",
-                        "znodes",
-                        "valuemultiplier"]:
-                if key in a:
-                    headers[key] = float(a.split()[2]) #Known position FTW
-            #All right, it may also be time data, which we should capture
-            if "Total simulation time" in a:
-                #Split on the colon to get the time with units;
-                #strip spaces and split on the space to separate time and units
-                #Finally, pluck out the time, stripping defensively
-                #(which should be unnecessary).
-                extraCaptures['SimTime'] = float(a.split(":")[-1].strip().split()[0].strip())
-            if "Iteration:" in a:
-                #Another tricky split...
-                extraCaptures['Iteration'] = float(a.split(":")[2].split(",")[0].strip())
-            if "Stage:" in a:
-                extraCaptures['Stage'] = float(a.split(":")[2].split(",")[0].strip())
-            if "MIF source file" in a:
-                extraCaptures['MIFSource'] = a.split(":", 2)[2].strip()
+#File extensions treated as OVF files
+OVF_EXTENSIONS = ["omf", "ovf", "oef", "ohf"]
 
+#Compressed file extensions and how to open them for transparent decompression
+DECOMPRESSORS = {"gz": gzip.open,
+                 "bz2": bz2.open,
+                 "xz": lzma.open}
 
-        #Initialize array to be populated
-        outArray = np.zeros((int(headers["xnodes"]),
-                             int(headers["ynodes"]),
-                             int(headers["znodes"]),
-                             3))
+#Rows of a text data block converted per numpy call
+TEXT_CHUNK_LINES = 4096
+
+#Value width: (struct code, byte order mark) opening each binary data block
+BYTE_ORDER_MARKS = {4: ("f", 1234567.0),
+                    8: ("d", 123456789012345.0)}
+
+def unpackFile(filename, mmap=False, out=None, dtype=np.float64, roi=None, components=None):
+    """
+    Decode an OVF 1.0 or 2.0 file into an (x, y, z, valuedim) array.
+
+    filename may also be an open binary file-like object, which is read from
+    its current position, and .gz, .bz2 and .xz files are decompressed on
+    the fly. Neither can be memory-mapped, so they are always decoded in
+    full.
+
+    valuedim is 3 for vector fields and OVF 1.0 files, and whatever the
+    header declares for OVF 2.0 files (1 for scalar fields such as energy
+    densities).
+
+    dtype sets the precision of the result: np.float64 (the default),
+    np.float32, or "native" to keep the file's own precision (float32 for
+    Binary 4 data, float64 otherwise).
+
+    With mmap=True, binary data blocks are not read at all; a read-only view
+    onto the file is returned instead and pages are only loaded when touched.
+    Such views keep the file's precision until a valuemultiplier has to be
+    applied. Text data can't be mapped and is always decoded in full.
+
+    If out is given, the data is decoded straight into that array (which must
+    match the file's grid) instead of a freshly allocated one, and mmap is ignored.
+
+    roi cuts out a region of interest: a tuple of up to three slices (or
+    single indices) for x, y and z, steps included. components selects vector
+    components by index, slice or list. Dimensions are always kept, so the
+    result is still 4-D. Binary files are read through a mapping, so only the
+    selected cells are read from disk; text files are parsed in full and cut.
+    """
+    selection = _selection(roi, components)
+    mappable = _isMappable(filename)
+    with _openSource(filename) as f:
+        headers, extraCaptures, a = _parseHeaders(f)
 
         #Determine decoding mode and use that to populate the array
         print("Data indicator:", a)
-        decode = a.split()
-        if decode[3] == "Text":
-            return _textDecode(f, outArray, headers, extraCaptures)
-        elif decode[3] == "Binary" and decode[4] == "4":
-            #Determine endianness
-            endianflag = f.read(4)
-            if struct.unpack(">f", endianflag)[0] == 1234567.0:
-                print("Big-endian 4-byte detected.")
-                dc = struct.Struct(">f")
-            elif struct.unpack("<f", endianflag)[0] == 1234567.0:
-                print("Little-endian 4-byte detected.")
-                dc = struct.Struct("<f")
-            else:
-                raise Exception("Can't decode 4-byte byte order mark: " + hex(endianflag))
-            return _binaryDecode(f, 4, dc, outArray, headers, extraCaptures)
-        elif decode[3] == "Binary" and decode[4] == "8":
-            #Determine endianness
-            endianflag = f.read(8)
-            if struct.unpack(">d", endianflag)[0] == 123456789012345.0:
-                print("Big-endian 8-byte detected.")
-                dc = struct.Struct(">d")
-            elif struct.unpack("<d", endianflag)[0] == 123456789012345.0:
-                print("Little-endian 8-byte detected.")
-                dc = struct.Struct("<d")
-            else:
-                raise Exception("Can't decode 8-byte byte order mark: " + hex(endianflag))
-            return _binaryDecode(f, 8, dc, outArray, headers, extraCaptures)
+        dataFormat = _dataFormat(a)
+        dtype = _resolveDtype(dtype, dataFormat)
+        dc = None
+        if not dataFormat == "Text":
+            chunksize = int(dataFormat.split()[1])
+            dc = _readByteOrderMark(f, chunksize)
+            if mmap and out is None and mappable:
+                return _mmapDecode(filename, f.tell(), dc, headers, extraCaptures, dtype, selection)
+            if selection is not None and mappable:
+                data = _mapBlock(filename, f.tell(), dc, headers)[selection]
+                return (_scaleInto(data, headers, out, dtype), headers, extraCaptures)
+            if mmap and out is None:
+                print("Streams can't be memory-mapped, decoding in full.")
+        elif mmap:
+            print("Text data can't be memory-mapped, decoding in full.")
+
+        if selection is not None:
+            array = _decodeInto(f, dc, np.zeros(_gridShape(headers), dtype=dtype), headers, extraCaptures)[0]
+            #Text and streams have to be decoded in full (and are already scaled) before they can be cut down
+            return (_scaleInto(array[selection], {}, out, dtype), headers, extraCaptures)
+
+        #Initialize array to be populated
+        if out is None:
+            outArray = np.zeros(_gridShape(headers), dtype=dtype)
+        elif out.shape == _gridShape(headers):
+            outArray = out
         else:
-            raise Exception("Unknown OOMMF data format:" + decode[3] + " " + decode[4])
+            raise Exception("Grid of %s is %r, expected %r" % (filename, _gridShape(headers), out.shape))
+
+        return _decodeInto(f, dc, outArray, headers, extraCaptures)
+
+
+def _decodeInto(filehandle, decoder, targetarray, headers, extraCaptures):
+    """
+    Decode the data block at the handle into targetarray: a text block when
+    decoder is None, or a binary block read with the byte order mark's decoder.
+    """
+    if decoder is None:
+        return _textDecode(filehandle, targetarray, headers, extraCaptures)
+    return _binaryDecode(filehandle, decoder.size, decoder, targetarray, headers, extraCaptures)
+
+
+def openOVF(filename):
+    """
+    Open an OVF file (a path string or os.PathLike) for binary reading,
+    decompressing .gz, .bz2 and .xz files.
+    """
+    filename = os.fspath(filename)
+    opener = DECOMPRESSORS.get(filename.rsplit(".", 1)[-1].lower(), open)
+    return opener(filename, 'rb')
+
+
+def isOVFName(name, extensions=OVF_EXTENSIONS):
+    """
+    True if name has an OVF extension, optionally followed by a compression one.
+    """
+    parts = os.fspath(name).lower().rsplit(".", 2)
+    if len(parts) > 2 and parts[-1] in DECOMPRESSORS:
+        return parts[-2] in extensions
+    return len(parts) > 1 and parts[-1] in extensions
+
+
+def iterArchive(archive, dtype=np.float64, extensions=OVF_EXTENSIONS):
+    """
+    Decode the OVF members of a tar or zip archive, in archive order.
+
+    Yields (memberName, array, headers, extraCaptures). Members are streamed
+    straight from the archive into the decoder, without extracting anything
+    to disk; compressed tarballs and compressed members (.ovf.gz and so on)
+    are decompressed on the fly. archive is a path or, for tar archives, an
+    open binary file-like object.
+    """
+    if not hasattr(archive, "read") and zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as z:
+            for info in z.infolist():
+                if isOVFName(info.filename, extensions):
+                    with z.open(info) as member:
+                        yield (info.filename,) + _unpackMember(member, info.filename, dtype)
+        return
+    if hasattr(archive, "read"):
+        tar = tarfile.open(fileobj=archive, mode="r|*")
+    else:
+        tar = tarfile.open(archive, mode="r|*")
+    with tar:
+        for info in tar:
+            if info.isfile() and isOVFName(info.name, extensions):
+                member = tar.extractfile(info)
+                yield (info.name,) + _unpackMember(member, info.name, dtype)
+
+
+def _unpackMember(member, name, dtype):
+    """
+    Decode one archive member stream, decompressing it first if its name says so.
+    """
+    extension = name.rsplit(".", 1)[-1].lower()
+    if extension == "gz":
+        member = gzip.GzipFile(fileobj=member)
+    elif extension == "bz2":
+        member = bz2.BZ2File(member)
+    elif extension == "xz":
+        member = lzma.LZMAFile(member)
+    return unpackFile(member, dtype=dtype)
+
+
+@contextmanager
+def _openSource(source):
+    """
+    Binary handle onto a filename or file-like object; only handles opened
+    here are closed afterwards.
+    """
+    if hasattr(source, "read"):
+        yield source
+    else:
+        with openOVF(source) as f:
+            yield f
+
+
+def _isMappable(source):
+    """
+    True if source is an uncompressed file on disk, which can be memory-mapped.
+    """
+    if hasattr(source, "read"):
+        return False
+    return not os.fspath(source).rsplit(".", 1)[-1].lower() in DECOMPRESSORS
+
+
+def _dataFormat(dataIndicator):
+    """
+    Canonical data format ("Text", "Binary 4" or "Binary 8") named by a
+    "Begin: Data" line, which OVF 2.0 allows in any case.
+    """
+    decode = dataIndicator.lower().split("begin:", 1)[-1].split()[1:]
+    if decode == ["text"]:
+        return "Text"
+    if decode in (["binary", "4"], ["binary", "8"]):
+        return "Binary " + decode[1]
+    raise Exception("Unknown OOMMF data format: " + " ".join(decode))
+
+
+def iterSegments(filename, mmap=False, dtype=np.float64):
+    """
+    Decode every segment of a multi-segment OVF file in turn.
+
+    Yields (array, headers, extraCaptures) for each "Begin: Segment" block,
+    as unpackFile does for the first one. Segments are read lazily from a
+    single open handle, so the file is only read once and only one segment
+    is decoded at a time. With mmap=True, binary segments are yielded as
+    read-only views as in unpackFile and their data is skipped over.
+    Like unpackFile, filename may be a file-like object or a compressed
+    file, in which case mmap is ignored.
+    """
+    mmap = mmap and _isMappable(filename)
+    with _openSource(filename) as f:
+        while _nextSegment(f):
+            headers, extraCaptures, a = _parseHeaders(f)
+            dataFormat = _dataFormat(a)
+            segmentDtype = _resolveDtype(dtype, dataFormat)
+            dc = None
+            if not dataFormat == "Text":
+                dc = _readByteOrderMark(f, int(dataFormat.split()[1]))
+            if mmap and dc is not None:
+                offset = f.tell()
+                yield _mmapDecode(filename, offset, dc, headers, extraCaptures, segmentDtype)
+                f.seek(offset + dc.size * int(np.prod(_gridShape(headers))))
+            else:
+                array = np.zeros(_gridShape(headers), dtype=segmentDtype)
+                yield _decodeInto(f, dc, array, headers, extraCaptures)
+
+
+def _nextSegment(filehandle):
+    """
+    Skip ahead past the next "Begin: Segment" line; False at end of file.
+    """
+    for line in iter(filehandle.readline, b""):
+        if b"begin: segment" in line.lower():
+            return True
+    return False
+
+
+def _resolveDtype(dtype, dataFormat):
+    """
+    Turn a dtype option into a numpy dtype for a data block of the given
+    format ("Text", "Binary 4" or "Binary 8").
+    """
+    if isinstance(dtype, str) and dtype == "native":
+        if dataFormat.split() == ["Binary", "4"]:
+            return np.dtype(np.float32)
+        return np.dtype(np.float64)
+    dtype = np.dtype(dtype)
+    if not dtype in (np.float32, np.float64):
+        raise Exception("Unsupported decode precision: %s" % dtype)
+    return dtype
+
+
+def _selection(roi, components):
+    """
+    Index tuple for an (x, y, z, component) array from roi and components,
+    or None when everything is wanted. Single indices become one-element
+    slices so no dimension is dropped.
+    """
+    if roi is None and components is None:
+        return None
+    index = []
+    for axis in tuple(roi or ()) + (None,) * (3 - len(roi or ())):
+        index.append(_keepDim(axis))
+    if isinstance(components, (list, tuple)):
+        index.append(list(components))
+    else:
+        index.append(_keepDim(components))
+    return tuple(index)
+
+
+def _keepDim(axis):
+    """
+    Slice for one axis of a selection: None is everything, an integer is a
+    one-element slice, and a slice is used as is.
+    """
+    if axis is None:
+        return slice(None)
+    if isinstance(axis, slice):
+        return axis
+    axis = int(axis)
+    return slice(axis, axis + 1 or None)
+
+
+def _selectionShape(shape, selection):
+    """
+    Shape of array[selection] for an array of the given shape, without
+    allocating it.
+    """
+    if selection is None:
+        return shape
+    dummy = np.lib.stride_tricks.as_strided(np.zeros(1), shape=shape, strides=(0,) * len(shape))
+    return dummy[selection].shape
+
+
+def _scaleInto(data, headers, out=None, dtype=np.float64):
+    """
+    Copy data into out (or a new array of dtype), applying valuemultiplier.
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=dtype)
+    elif not out.shape == data.shape:
+        raise Exception("Selection is %r, expected %r" % (data.shape, out.shape))
+    np.multiply(data, headers.get("valuemultiplier", 1), out=out,
+                dtype=np.float64, casting="same_kind")
+    return out
+
+
+def _gridShape(headers):
+    """
+    Shape of the (x, y, z, valuedim) array holding the data described by headers.
+    """
+    return (int(headers["xnodes"]),
+            int(headers["ynodes"]),
+            int(headers["znodes"]),
+            _valueDim(headers))
+
+
+def _valueDim(headers):
+    """
+    Values per cell: the OVF 2.0 valuedim, or 3 for OVF 1.0 vector files.
+    """
+    return int(headers.get("valuedim", 3))
+
+
+def scanHeaders(filename):
+    """
+    Read only the header of an OVF file, stopping at "Begin: Data".
+
+    Returns a dictionary of every "key: value" header field (numbers as
+    floats, Desc lines as a list), the SimTime/Iteration/Stage/MIFSource
+    captures, and DataFormat, DataOffset and DataLength describing the data
+    block. DataLength counts the byte order mark and is None for text data,
+    whose length can't be known without reading it. Compressed files are
+    decompressed as far as the end of the header; DataOffset then counts
+    decompressed bytes.
+    """
+    fields = {}
+    with _openSource(filename) as f:
+        headers, extraCaptures, a = _parseHeaders(f, fields)
+        fields.update(extraCaptures)
+        fields['DataFormat'] = _dataFormat(a)
+        fields['DataOffset'] = f.tell()
+    fields['DataLength'] = None
+    decode = fields['DataFormat'].split()
+    if decode[0] == "Binary":
+        chunksize = int(decode[1])
+        fields['DataLength'] = chunksize * (1 + _valueDim(headers) * int(headers["xnodes"])
+                                            * int(headers["ynodes"])
+                                            * int(headers["znodes"]))
+    return fields
+
+
+def scanDirectory(directory, extensions=OVF_EXTENSIONS):
+    """
+    Scan the headers of every OVF file in a directory.
+
+    Returns a filename-sorted list of (path, fields) pairs as produced by
+    scanHeaders. Files whose header can't be parsed are reported and skipped.
+    """
+    scanned = []
+    for name in sorted(os.listdir(directory)):
+        if not isOVFName(name, extensions):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            scanned.append((path, scanHeaders(path)))
+        except Exception as e:
+            print("Skipping unreadable header in %s: %r" % (path, e))
+    return scanned
+
+
+def _parseHeaders(filehandle, fields=None):
+    """
+    Read header lines up to and including the "Begin: Data" line.
+
+    Returns (headers, extraCaptures, dataIndicator). If a fields dictionary
+    is passed in, every "key: value" header line is also collected into it.
+    """
+    headers = {} #I know valuemultiplier isn't always present. This is checked later.
+    extraCaptures = {'SimTime':-1, 'Iteration':-1, 'Stage':-1, "MIFSource":""}
+    #Parse headers
+    a = ""
+    while not "begin: data" in a.lower():
 
+        line = filehandle.readline()
+        if not line:
+            raise Exception("No data block found in OOMMF file header")
+        a = line.strip().decode()
+        if fields is not None:
+            _collectField(a, fields)
+        #Determine if it's actually something we need as header data
+        for key in ["xbase",
+                    "ybase",
+                    "zbase",
+                    "xstepsize",
+                    "ystepsize",
+                    "zstepsize",
+                    "xnodes",
+                    "ynodes",
+                    "znodes",
+                    "valuedim",
+                    "valuemultiplier"]:
+            if key in a:
+                headers[key] = float(a.split()[2]) #Known position FTW
+        #All right, it may also be time data, which we should capture
+        if "Total simulation time" in a:
+            #Split on the colon to get the time with units;
+            #strip spaces and split on the space to separate time and units
+            #Finally, pluck out the time, stripping defensively
+            #(which should be unnecessary).
+            extraCaptures['SimTime'] = float(a.split(":")[-1].strip().split()[0].strip())
+        if "Iteration:" in a:
+            #Another tricky split...
+            extraCaptures['Iteration'] = float(a.split(":")[2].split(",")[0].strip())
+        if "Stage:" in a:
+            extraCaptures['Stage'] = float(a.split(":")[2].split(",")[0].strip())
+        if "MIF source file" in a:
+            extraCaptures['MIFSource'] = a.split(":", 2)[2].strip()
+    return headers, extraCaptures, a
+
+
+def _collectField(line, fields):
+    """
+    Store a single "# key: value" header line in fields.
+    """
+    if not line.startswith("#") or not ":" in line:
+        return
+    key, value = line.lstrip("#").split(":", 1)
+    key = key.strip()
+    value = value.strip()
+    if key in ("Begin", "End"):
+        return
+    if key == "Desc":
+        fields.setdefault("Desc", []).append(value)
+        return
+    try:
+        fields[key] = float(value)
+    except ValueError:
+        fields[key] = value
+
+
+def _readByteOrderMark(filehandle, chunksize):
+    """
+    Read the byte order mark opening a binary data block.
+
+    Returns a struct.Struct decoder for one value of the block.
+    """
+    code, mark = BYTE_ORDER_MARKS[chunksize]
+    endianflag = filehandle.read(chunksize)
+    if struct.unpack(">" + code, endianflag)[0] == mark:
+        print("Big-endian %d-byte detected." % chunksize)
+        return struct.Struct(">" + code)
+    elif struct.unpack("<" + code, endianflag)[0] == mark:
+        print("Little-endian %d-byte detected." % chunksize)
+        return struct.Struct("<" + code)
+    raise Exception("Can't decode %d-byte byte order mark: %r" % (chunksize, endianflag))
+
+
+def _mmapDecode(filename, offset, decoder, headers, extraCaptures, dtype=np.float64,
+                selection=None):
+    """
+    Map a binary data block starting at offset without reading it.
+
+    The returned array is a read-only (x, y, z, valuedim) view onto the file, cut
+    down to selection if one is given. When the file carries a
+    valuemultiplier other than 1 the view is wrapped in a ScaledArrayView of
+    the given dtype, which only multiplies the parts that are indexed out.
+    """
+    valm = headers.get("valuemultiplier", 1)
+    data = _mapBlock(filename, offset, decoder, headers)
+    if selection is not None:
+        data = data[selection]
+    if not valm == 1:
+        data = ScaledArrayView(data, valm, dtype)
+    return (data, headers, extraCaptures)
+
+
+def _mapBlock(filename, offset, decoder, headers):
+    """
+    Read-only, unscaled (x, y, z, valuedim) memmap of the binary data block at offset.
+    """
+    xnodes, ynodes, znodes, valuedim = _gridShape(headers)
+    data = np.memmap(filename, dtype=_binaryDtype(decoder), mode="r",
+                     offset=offset, shape=(znodes, ynodes, xnodes, valuedim))
+    return data.transpose(2, 1, 0, 3)
+
+
+class ScaledArrayView(object):
+    """
+    Read-only array stand-in that applies a constant multiplier on access.
+
+    Indexing returns a plain ndarray of the view's dtype holding only the
+    requested values, scaled; np.asarray() scales the whole thing.
+    """
+    def __init__(self, base, multiplier, dtype=np.float64):
+        self.base = base
+        self.multiplier = multiplier
+        self.shape = base.shape
+        self.ndim = base.ndim
+        self.size = base.size
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return np.multiply(self.base[key], self.multiplier, dtype=np.float64).astype(self.dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[...]
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
 
 
 def _textDecode(filehandle, targetarray, headers, extraCaptures):
     """
+    Decode a text data block in bulk.
+
+    Lines are pulled off the handle TEXT_CHUNK_LINES at a time and each chunk is
+    tokenized and converted by numpy in one go, so the handle is left exactly at
+    the "# End: Data Text" line no matter how large the block is.
     """
     valm = headers.get("valuemultiplier", 1)
-    for k in range(int(headers["znodes"])):
-        for j in range(int(headers["ynodes"])):
-            for i in range(int(headers["xnodes"])):
-                #numpy is fantastic - splice in a tuple
-                text = filehandle.readline().strip().split()
-                targetarray[i, j, k] = (float(text[0])*valm,
-                                        float(text[1])*valm,
-                                        float(text[2])*valm)
+    xnodes, ynodes, znodes, valuedim = _gridShape(headers)
+    cells = xnodes * ynodes * znodes
+    data = np.empty(cells * valuedim)
+    done = 0
+    while done < cells:
+        lines = list(islice(filehandle, min(TEXT_CHUNK_LINES, cells - done)))
+        if not lines:
+            break
+        values = lines[0][:0].join(lines).split()
+        if len(values) != valuedim * len(lines):
+            #Either an early "# End: Data Text" or a malformed row
+            break
+        data[valuedim * done:valuedim * (done + len(lines))] = np.array(values, dtype=float)
+        done += len(lines)
+    if done < cells:
+        raise Exception("Truncated text data block: expected %d rows, got %d" % (cells, done))
+    data = data.reshape((znodes, ynodes, xnodes, valuedim)).transpose(2, 1, 0, 3)
+    np.multiply(data, valm, out=targetarray[:xnodes, :ynodes, :znodes],
+                dtype=np.float64, casting="same_kind")
     print("Decode complete.")
     return (targetarray, headers, extraCaptures)
 
 
 def _binaryDecode(filehandle, chunksize, decoder, targetarray, headers, extraCaptures):
     """
+    Decode a binary data block in a single read.
+
+    The whole block is pulled in at once and reinterpreted with np.frombuffer,
+    using the byte order and width of the decoder found from the byte order mark.
+    OOMMF writes x fastest, so the flat block is reshaped z, y, x, coord and
+    transposed back into the (x, y, z, coord) layout of targetarray.
     """
     valm = headers.get("valuemultiplier", 1)
-    for k in range(int(headers["znodes"])):
-        for j in range(int(headers["ynodes"])):
-            for i in range(int(headers["xnodes"])):
-                for coord in range(3): #Slowly populate, coordinate by coordinate
-                    targetarray[i, j, k, coord] = decoder.unpack(filehandle.read(chunksize))[0] * valm
+    xnodes, ynodes, znodes, valuedim = _gridShape(headers)
+    count = xnodes * ynodes * znodes * valuedim
+    raw = filehandle.read(count * chunksize)
+    if len(raw) != count * chunksize:
+        raise Exception("Truncated binary data block: expected %d bytes, got %d"
+                        % (count * chunksize, len(raw)))
+    data = np.frombuffer(raw, dtype=_binaryDtype(decoder), count=count)
+    data = data.reshape((znodes, ynodes, xnodes, valuedim)).transpose(2, 1, 0, 3)
+    np.multiply(data, valm, out=targetarray[:xnodes, :ynodes, :znodes],
+                dtype=np.float64, casting="same_kind")
     print("Decode complete.")
     return (targetarray, headers, extraCaptures)
 
-def pickleArray(array, headers, extraCaptures, filename):
+def _binaryDtype(decoder):
     """
+    Translate a struct.Struct decoder (e.g. "<f", ">d") into the matching numpy dtype.
     """
+    fmt = decoder.format
+    if isinstance(fmt, bytes):
+        fmt = fmt.decode()
+    return np.dtype(fmt)
+
+def writeOVF(filename, array, fields, dataFormat="Binary 8", version=1):
+    """
+    Write an (x, y, z, valuedim) array as a single-segment OVF file.
+
+    fields supplies the header, as returned by scanHeaders or as the headers
+    and extra captures of unpackFile merged together: the grid geometry, and
+    optionally Title, Desc lines, meshunit, valueunit and the xmin..zmax
+    bounds, which are otherwise derived from the grid. Without Desc lines, the SimTime, Iteration, Stage and MIFSource
+    captures are written out as Desc lines so they survive a round trip.
+    The values are written as they are, with a valuemultiplier of 1.
+
+    dataFormat is "Binary 4", "Binary 8" or "Text". version 1 writes OVF 1.0
+    (big-endian binary, vectors only) and version 2 writes OVF 2.0
+    (little-endian binary, any valuedim). The data block is converted to
+    bytes in a single vectorized step.
+    """
+    array = np.asarray(array)
+    if not version in (1, 2):
+        raise Exception("Unknown OVF version: %r" % (version,))
+    if not dataFormat in ("Text", "Binary 4", "Binary 8"):
+        raise Exception("Unknown OOMMF data format: " + dataFormat)
+    if version == 1 and not array.shape[-1] == 3:
+        raise Exception("OVF 1.0 only holds vector data, got valuedim %d" % array.shape[-1])
+    lines = ["OOMMF: rectangular mesh v1.0" if version == 1 else "OOMMF OVF 2.0",
+             "Segment count: 1",
+             "Begin: Segment",
+             "Begin: Header",
+             "Title: %s" % fields.get("Title", "OOMMFTools output")]
+    lines += ["Desc: %s" % desc for desc in fields.get("Desc", _descLines(fields))]
+    lines += ["meshtype: rectangular", "meshunit: %s" % fields.get("meshunit", "m")]
+    bounds = {}
+    for axis, nodes in zip("xyz", array.shape):
+        base = float(fields[axis + "base"])
+        step = float(fields[axis + "stepsize"])
+        bounds[axis + "min"] = fields.get(axis + "min", base - step / 2)
+        bounds[axis + "max"] = fields.get(axis + "max", base + (nodes - 0.5) * step)
+    for key in ["xmin", "ymin", "zmin", "xmax", "ymax", "zmax"]:
+        lines.append("%s: %r" % (key, float(bounds[key])))
+    if version == 2:
+        lines += ["valuedim: %d" % array.shape[-1],
+                  "valuelabels: %s" % fields.get("valuelabels", " ".join(["value"] * array.shape[-1])),
+                  "valueunits: %s" % fields.get("valueunits",
+                                                " ".join([fields.get("valueunit", "1")] * array.shape[-1]))]
+    for key in ["xbase", "ybase", "zbase", "xstepsize", "ystepsize", "zstepsize"]:
+        lines.append("%s: %r" % (key, float(fields[key])))
+    for key, nodes in zip(["xnodes", "ynodes", "znodes"], array.shape):
+        lines.append("%s: %d" % (key, nodes))
+    if version == 1:
+        magnitudes = np.sqrt((np.asarray(array, dtype=np.float64) ** 2).sum(axis=-1))
+        lines += ["valueunit: %s" % fields.get("valueunit", "1"),
+                  "valuemultiplier: 1",
+                  "ValueRangeMinMag: %r" % float(magnitudes.min()),
+                  "ValueRangeMaxMag: %r" % float(magnitudes.max())]
+    lines += ["End: Header", "Begin: Data %s" % dataFormat]
+    header = "".join("# %s\n" % line for line in lines).encode()
+    #OOMMF writes x fastest
+    data = array.transpose(2, 1, 0, 3).reshape(-1, array.shape[-1])
+    with open(filename, 'wb') as f:
+        f.write(header)
+        if dataFormat == "Text":
+            np.savetxt(f, data, fmt="%.17g")
+        else:
+            chunksize = int(dataFormat.split()[1])
+            code, mark = BYTE_ORDER_MARKS[chunksize]
+            order = ">" if version == 1 else "<"
+            f.write(np.array([mark], dtype=order + code).tobytes())
+            f.write(np.ascontiguousarray(data, dtype=order + code).tobytes())
+            f.write(b"\n")
+        f.write(("# End: Data %s\n# End: Segment\n" % dataFormat).encode())
+
+def _descLines(extraCaptures):
+    """
+    Desc lines carrying extra captures, in the form OOMMF writes them.
+    """
+    lines = []
+    if extraCaptures.get("MIFSource"):
+        lines.append("MIF source file: %s" % extraCaptures["MIFSource"])
+    if extraCaptures.get("Iteration", -1) != -1:
+        lines.append("Iteration: %d" % extraCaptures["Iteration"])
+    if extraCaptures.get("Stage", -1) != -1:
+        lines.append("Stage: %d" % extraCaptures["Stage"])
+    if extraCaptures.get("SimTime", -1) != -1:
+        lines.append("Total simulation time: %r s" % float(extraCaptures["SimTime"]))
+    return lines
+
+def pickleArray(array, headers, extraCaptures, filename, dtype=None):
+    """
+    Pickle (array, headers+extraCaptures) to filename.
+
+    The array keeps its own precision unless dtype is given. Disk-backed
+    stacks are pickled as plain arrays.
+    """
+    array = np.asarray(array, dtype=dtype)
     temp = dict(headers)
     temp.update(extraCaptures)
     f = open(filename, 'wb')
     pickle.dump((array, temp), f)
     f.close()
 
-def matlabifyArray(array, headers, extraCaptures, filename):
+def npyArray(array, headers, extraCaptures, filename, dtype=None):
+    """
+    Save array as a plain .npy file, with a JSON sidecar for the metadata.
+
+    The sidecar sits next to filename with a .json extension and holds the
+    headers and extra captures. Unlike a pickle, the array can be reopened
+    lazily with loadNpyArray or np.load(filename, mmap_mode='r'). The array
+    keeps its own precision unless dtype is given.
+    """
+    if dtype is not None:
+        array = np.asarray(array, dtype=dtype)
+    #Through a handle, so np.save doesn't append .npy to other extensions
+    with open(filename, 'wb') as f:
+        np.save(f, array)
+    with open(npySidecar(filename), 'w') as f:
+        json.dump({"headers": headers, "extra": extraCaptures}, f, indent=1)
+
+def loadNpyArray(filename, mmap=True):
+    """
+    Reopen an npyArray export as (array, headers, extraCaptures).
+
+    With mmap=True the array is a read-only memory map, so nothing is read
+    from disk until frames are indexed.
+    """
+    array = np.load(filename, mmap_mode="r" if mmap else None)
+    with open(npySidecar(filename)) as f:
+        metadata = json.load(f)
+    return (array, metadata["headers"], metadata["extra"])
+
+def npySidecar(filename):
+    """
+    Path of the JSON metadata sidecar belonging to an .npy export.
+    """
+    return os.path.splitext(filename)[0] + ".json"
+
+def matlabifyArray(array, headers, extraCaptures, filename, dtype=None):
     """
+    Save array as OOMMFData in a MATLAB file, with GridSize and the extra captures.
+
+    The array keeps its own precision (float32 is stored as single) unless
+    dtype is given.
     """
+    if dtype is not None:
+        array = np.asarray(array, dtype=dtype)
     GridSize = np.array([float(headers["xstepsize"]),
                          float(headers["ystepsize"]),
                          float(headers["zstepsize"])])
@@ -131,28 +741,58 @@ def matlabifyArray(array, headers, extraCaptures, filename):
     OutDict.update(extraCaptures)
     spio.savemat(filename, OutDict)
 
-def slowlyPainfullyMaximize(filenames):
+def slowlyPainfullyMaximize(filenames, forceScan=False, cache=None):
     """
     This is a special utility function used by OOMMFConvert to find the single largest-magnitude
     vector in a set of vector files
+
+    Files whose header carries ValueRangeMaxMag are answered from the header
+    alone; pass forceScan=True to decode and scan every file regardless.
+    Decoded files go through cache when one is given.
     """
-    #There is no nice way to do this.
-    def mag(a, b, c):
-        """
-        """
-        return np.sqrt(a**2 + b**2 + c**2)
+    unpack = cache.unpackFile if cache else unpackFile
     maxmag = 0
 
     for filename in filenames:
-        thisArray, headers, extraCaps = unpackFile(filename)
-        for k in range(int(headers["znodes"])):
-            for j in range(int(headers["ynodes"])):
-                for i in range(int(headers["xnodes"])):
-                    maxmag = max(maxmag, mag(*thisArray[i, j, k]))
+        if not forceScan:
+            fields = scanHeaders(filename)
+            if "ValueRangeMaxMag" in fields:
+                maxmag = max(maxmag, fields["ValueRangeMaxMag"] * fields.get("valuemultiplier", 1))
+                continue
+        thisArray, headers, extraCaps = unpack(filename, mmap=True)
+        maxmag = max(maxmag, maxMagnitude(thisArray))
     return maxmag
 
 
+def maxMagnitude(array):
+    """
+    Largest vector magnitude in an array whose last axis holds the components.
+    """
+    array = np.asarray(array)
+    return np.sqrt(np.max(np.sum(np.square(array), axis=-1)))
+
+
+def orderByHeaders(targetList):
+    """
+    Return targetList sorted into time order from the file headers alone.
+
+    Files are ordered by SimTime, then Stage, then Iteration, then filename,
+    so passing the result to groupUnpack decodes every frame straight into
+    its final slot. Missing captures (-1) sort first within their key.
+    """
+    def key(target):
+        fields = scanHeaders(target)
+        return (fields["SimTime"], fields["Stage"], fields["Iteration"], target)
+    return [target for sortKey, target in sorted((key(target), target) for target in targetList)]
+
+
 def sortBySimTime(extra, arrays):
+    """
+    Reorder already-decoded arrays and extra captures by SimTime.
+
+    Only applies when all files share one MIFSource and every SimTime is
+    known. Prefer orderByHeaders, which orders files before decoding.
+    """
 
     # We do some enumeration later on that needs 'arrays'
     # to be an iterable.
@@ -180,19 +820,171 @@ def sortBySimTime(extra, arrays):
     return arrays, extra
 
 
-def groupUnpack(targetList):
-    decodedArrays = []
+def groupUnpack(targetList, workers=1, useProcesses=False, progress=None, cache=None,
+                dtype=np.float64, roi=None, components=None, memoryBudget=None,
+                scratchDir=None):
+    """
+    Decode a list of OVF files into a single (nframes, x, y, z, valuedim) stack.
+
+    The stack is allocated up front from the first file's header and every
+    file is decoded straight into its own slot, so no frame is ever copied.
+    All files must share the same grid. dtype, roi and components are as for
+    unpackFile; "native" follows the precision of the first file.
+
+    With workers > 1 the files are decoded in parallel: by a thread pool
+    writing directly into the stack (best for binary files), or with
+    useProcesses=True by a process pool whose frames are copied into place
+    (best for text files, whose parsing holds the GIL). progress, if given,
+    is called as progress(index, filename) in the calling thread as each file
+    finishes. Frame order and extraData always follow targetList.
+
+    If a decodecache.DecodeCache is passed as cache, files are decoded
+    through it.
+
+    memoryBudget caps the size in bytes of a stack held in RAM. A larger
+    stack is spilled to a disk-backed np.memmap in a temporary file in
+    scratchDir (the system temporary directory by default), which is
+    deleted once the stack is released; it is used like any other array.
+    """
     headers = {}
     extraData = defaultdict(list)
-    firstTime = True
-    for target in targetList:
-        collect = unpackFile(target)
-        if firstTime:
-            firstTime = False
-            headers = collect[1]
-        decodedArrays.append(collect[0])
+    if not targetList:
+        return (np.array([]), headers, extraData)
+    first = scanHeaders(targetList[0])
+    dtype = _resolveDtype(dtype, first["DataFormat"])
+    options = _decodeOptions(roi, components)
+    frameShape = _selectionShape(_gridShape(first), _selection(roi, components))
+    decodedArrays = _allocateStack((len(targetList),) + frameShape, dtype, memoryBudget,
+                                   scratchDir)
+    collected = [None] * len(targetList)
+    if workers > 1 and useProcesses:
+        pool = multiprocessing.Pool(workers)
+        options["dtype"] = dtype
+        jobs = pool.imap_unordered(partial(_unpackIndexed, cache=cache, options=options),
+                                   enumerate(targetList))
+    elif workers > 1:
+        pool = ThreadPool(workers)
+        jobs = pool.imap_unordered(partial(_unpackIndexed, stack=decodedArrays, cache=cache,
+                                           options=options),
+                                   enumerate(targetList))
+    else:
+        pool = None
+        jobs = (_unpackIndexed(job, decodedArrays, cache, options) for job in enumerate(targetList))
+    try:
+        for i, array, fileHeaders, extra in jobs:
+            if array is not None:
+                if not array.shape == decodedArrays.shape[1:]:
+                    raise Exception("Grid of %s is %r, expected %r"
+                                    % (targetList[i], array.shape, decodedArrays.shape[1:]))
+                decodedArrays[i] = array
+            collected[i] = (fileHeaders, extra)
+            if progress:
+                progress(i, targetList[i])
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    headers = collected[0][0]
+    for fileHeaders, extra in collected:
         #Unpack extra collected data
-        for key, value in list(collect[2].items()):
+        for key, value in list(extra.items()):
             extraData[key].append(value)
 
-    return (np.array(decodedArrays), headers, extraData)
\ No newline at end of file
+    return (decodedArrays, headers, extraData)
+
+
+def _allocateStack(shape, dtype, memoryBudget=None, scratchDir=None):
+    """
+    Zeroed array of shape and dtype, in RAM if it fits memoryBudget bytes
+    (or there is no budget) and memory-mapped onto a scratch file otherwise.
+    """
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if memoryBudget is None or size <= memoryBudget:
+        return np.zeros(shape, dtype=dtype)
+    print("Stack of %d bytes exceeds the %d byte memory budget, spilling to disk." % (size, memoryBudget))
+    #An anonymous temporary file: the mapping keeps it alive, and it goes away with the stack
+    return np.memmap(tempfile.TemporaryFile(dir=scratchDir), dtype=dtype, mode="w+", shape=shape)
+
+
+def _decodeOptions(roi, components):
+    """
+    unpackFile keyword arguments for a selection, leaving out unset ones so
+    cache keys don't depend on how the defaults were spelled.
+    """
+    options = {}
+    if roi is not None:
+        options["roi"] = roi
+    if components is not None:
+        options["components"] = components
+    return options
+
+
+def _unpackIndexed(job, stack=None, cache=None, options=None):
+    """
+    Pool worker for groupUnpack: decode job = (index, filename).
+
+    Decodes into stack[index] when a shared stack is given and returns
+    (index, None, headers, extra); otherwise returns the decoded array in
+    place of None so it can be shipped back from another process. options
+    are passed on to unpackFile.
+    """
+    i, target = job
+    unpack = cache.unpackFile if cache else unpackFile
+    if stack is None:
+        array, headers, extra = unpack(target, **(options or {}))
+        return (i, array, headers, extra)
+    array, headers, extra = unpack(target, out=stack[i], **(options or {}))
+    return (i, None, headers, extra)
+
+
+def iterUnpack(targetList, reuseBuffer=False, cache=None, dtype=np.float64,
+               roi=None, components=None):
+    """
+    Decode OVF files one at a time, yielding (array, headers, extra) per file.
+
+    With reuseBuffer=True every frame is decoded into the same array, so memory
+    stays at a single frame; each yielded array is then only valid until the
+    next one is produced. All files must share the same grid in that case.
+    Files are decoded through cache when one is given; dtype, roi and
+    components are as for unpackFile.
+    """
+    unpack = cache.unpackFile if cache else unpackFile
+    options = _decodeOptions(roi, components)
+    buf = None
+    for target in targetList:
+        if reuseBuffer and buf is None:
+            fields = scanHeaders(target)
+            buf = np.zeros(_selectionShape(_gridShape(fields), _selection(roi, components)),
+                           dtype=_resolveDtype(dtype, fields["DataFormat"]))
+        if buf is None:
+            yield unpack(target, dtype=dtype, **options)
+        else:
+            yield unpack(target, out=buf, **options)
+
+
+def probeSeries(targetList, points, components=None, dtype=np.float64, cache=None):
+    """
+    Extract point-probe time series from a list of OVF files.
+
+    points is a sequence of (i, j, k) cell indices. Binary files are mapped,
+    so only the pages holding those cells are read. Returns
+    (series, extraData) where series has shape (nfiles, npoints, ncomponents)
+    and extraData holds the per-file SimTime, Iteration and so on.
+    """
+    unpack = cache.unpackFile if cache else unpackFile
+    points = np.asarray(points, dtype=int).reshape(-1, 3)
+    select = _selection((), components)[-1]
+    series = None
+    extraData = defaultdict(list)
+    for n, target in enumerate(targetList):
+        view, headers, extra = unpack(target, mmap=True, dtype=dtype)
+        values = np.asarray(view[points[:, 0], points[:, 1], points[:, 2]])[:, select]
+        if series is None:
+            if not (isinstance(dtype, str) and dtype == "native"):
+                values = values.astype(_resolveDtype(dtype, ""), copy=False)
+            series = np.zeros((len(targetList),) + values.shape, dtype=values.dtype)
+        series[n] = values
+        for key, value in list(extra.items()):
+            extraData[key].append(value)
+    return (series, extraData)
@@ -0,0 +1,120 @@
+"""
+Rewrite text OVF files as binary.
+
+Text OVF files are about three times the size of binary ones and far slower
+to decode. compactFiles rewrites them as binary, in place or into a mirror
+tree, and checks that every rewritten file decodes to the same values as
+the original before it is kept.
+
+Run as: python -m oommftools.core.ovfcompact [-o MIRROR] [--binary4] PATH...
+"""
+from __future__ import print_function
+import os
+import sys
+import shutil
+import argparse
+import numpy as np
+from . import oommfdecode
+
+
+def compactFiles(targetList, outputDir=None, root=None, dataFormat="Binary 8",
+                 verify=True, progress=None):
+    """
+    Rewrite the text OVF files in targetList as binary.
+
+    Without outputDir each text file is replaced in place, and binary files
+    are left alone. With outputDir the files are written to a mirror tree
+    below it, keeping their paths relative to root (by default the common
+    directory of targetList); binary files are copied across unchanged so
+    the mirror is complete.
+
+    Files keep their OVF version, so OVF 2.0 files (including scalar ones)
+    stay OVF 2.0. With verify=True every rewritten file is decoded again
+    and compared with the original (to float32 precision for "Binary 4").
+    A file that fails to decode, write or verify is left untouched and
+    doesn't stop the others. progress, if given, is called as
+    progress(index, filename) after each file. Returns (compacted, errors):
+    the list of files that were rewritten, and a dictionary of the error
+    message of every file that failed.
+    """
+    if outputDir is not None and root is None and targetList:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(target))
+                                   for target in targetList])
+    compacted = []
+    errors = {}
+    for i, target in enumerate(targetList):
+        try:
+            fields = oommfdecode.scanHeaders(target)
+            if outputDir is None:
+                destination = target
+            else:
+                destination = os.path.join(outputDir, os.path.relpath(os.path.abspath(target), root))
+                if not os.path.isdir(os.path.dirname(destination)):
+                    os.makedirs(os.path.dirname(destination))
+            if fields["DataFormat"] == "Text":
+                _compactFile(target, destination, fields, dataFormat, verify)
+                compacted.append(destination)
+            elif not destination == target:
+                shutil.copy2(target, destination)
+        except Exception as e:
+            print("Couldn't compact %s: %s" % (target, e))
+            errors[target] = str(e) or repr(e)
+        if progress:
+            progress(i, target)
+    return (compacted, errors)
+
+
+def _ovfVersion(fields):
+    """
+    OVF version of a file from its header fields: only OVF 2.0 has valuedim.
+    """
+    if "valuedim" in fields or "2.0" in fields.get("OOMMF", ""):
+        return 2
+    return 1
+
+
+def _compactFile(target, destination, fields, dataFormat, verify):
+    """
+    Rewrite one text file as binary, through a temporary file next to destination.
+    """
+    array = oommfdecode.unpackFile(target)[0]
+    temp = destination + ".compacting"
+    try:
+        oommfdecode.writeOVF(temp, array, fields, dataFormat, _ovfVersion(fields))
+        if verify:
+            expected = array.astype(np.float32) if dataFormat == "Binary 4" else array
+            if not np.array_equal(oommfdecode.unpackFile(temp)[0], expected):
+                raise Exception("Round trip of %s doesn't match the original" % target)
+        os.replace(temp, destination)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Rewrite text OVF files as binary.")
+    parser.add_argument("paths", nargs="+", help="OVF files, or directories to search")
+    parser.add_argument("-o", "--output", help="write a mirror tree here instead of in place")
+    parser.add_argument("--binary4", action="store_true",
+                        help="write single precision (Binary 4) data")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="skip the round-trip check")
+    options = parser.parse_args(args)
+    targets = []
+    for path in options.paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                targets += [os.path.join(dirpath, name) for name in sorted(filenames)
+                            if name.rsplit(".", 1)[-1] in oommfdecode.OVF_EXTENSIONS]
+        else:
+            targets.append(path)
+    compacted, errors = compactFiles(targets, options.output, dataFormat="Binary 4" if options.binary4
+                             else "Binary 8", verify=not options.no_verify)
+    print("Compacted %d of %d files." % (len(compacted), len(targets)))
+    if errors:
+        print("%d files could not be compacted." % len(errors))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
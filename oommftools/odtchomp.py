@@ -26,6 +26,7 @@ from __future__ import absolute_import
 from builtins import str
 from builtins import object
 import os
+import multiprocessing
 from wx import adv
 import wx
 import numpy as np
@@ -58,6 +59,9 @@ ALWAYS_CLEAR = ["Oxs_"]
 
 PROTECTED_NAMES = ["Exchange"]
 
+#Batch mode converts this many files at once, each in its own process
+CONVERT_WORKERS = multiprocessing.cpu_count()
+
 #######
 # GUI #
 #######
@@ -271,12 +275,6 @@ class MainFrame(wx.Frame):
         f.write("\n".join(self.digest.getNames()))
         f.close()
 
-    def _lightImportFile(self, filename):
-        """
-        """
-        #returns (Interpreter, exportPathname)
-        return (odtchomp.chomp(filename), os.path.dirname(filename))
-
     def exportFile(self, evt):
         """
         """
@@ -378,11 +376,24 @@ class ODTDropTarget(wx.FileDropTarget):
             return 0
         else:
             #batch mode
-            for fname in namepotential:
-                interp, outDir = self.parent._lightImportFile(fname)
-                outfname = fname.rsplit(os.path.sep, 1)[1].split(".")[0] + ".txt"
-                print(outDir, outfname)
-                odtchomp.write(outDir + os.path.sep + outfname, interp, self.parent.delim, self.parent.watching)
+            if not namepotential:
+                return 0
+            progdialog = wx.ProgressDialog("Batch Conversion", "Converting...",
+                                           maximum=len(namepotential))
+            done = [0]
+            def progress(index, fname, error):
+                done[0] += 1
+                progdialog.Update(done[0], os.path.basename(fname))
+            try:
+                errors = odtchomp.batchConvert(namepotential, self.parent.delim,
+                                               self.parent.watching, workers=CONVERT_WORKERS,
+                                               useProcesses=True, progress=progress)
+            finally:
+                progdialog.Destroy()
+            if errors:
+                wx.MessageBox("\n".join("%s: %s" % (os.path.basename(fname), error)
+                                        for fname, error in sorted(errors.items())),
+                              "Some files could not be converted")
             return 1
 
 
@@ -391,6 +402,8 @@ class ODTDropTarget(wx.FileDropTarget):
 # MAIN #
 ########
 if __name__ == "__main__":
+    #Batch mode spawns worker processes, which a frozen build must divert here
+    multiprocessing.freeze_support()
     app = wx.App(None)
     BigBoss = MainFrame()
     app.MainLoop()
@@ -26,7 +26,7 @@ standard_library.install_aliases()
 from builtins import hex
 from builtins import zip
 from builtins import range
-import time
+import multiprocessing
 from collections import defaultdict
 import pickle as pickle
 from wx import adv
@@ -35,9 +35,9 @@ import wx
 import struct
 import numpy as np
 import scipy.io as spio
-from fnameutil import filterOnExtensions
 import _about as about
 from core import oommfdecode
+from core import hdf5export
 
 #########
 # About #
@@ -59,6 +59,10 @@ arrays or MATLAB data files. Just drag and drop.
 ########
 
 LASTPATH = os.getcwd()
+#Files are decoded on a thread pool of this size; decode progress still reports per file
+DECODE_WORKERS = multiprocessing.cpu_count()
+#Drops whose decoded stack is larger than this many bytes are spilled to a scratch file
+DECODE_MEMORY_BUDGET = 2 * 1024 ** 3
 if __name__ == "__main__":
     #app = wx.App(None)
     #app = wx.App(None)
@@ -106,12 +110,22 @@ class MainFrame(wx.Frame):
 
         sizer.Add(wx.StaticLine(panel, -1), 0, wx.EXPAND | wx.TOP | wx.BOTTOM, 18)
 
-        self.doNumpy = wx.CheckBox(panel, -1, "Create pickled numpy")
+        self.doNumpy = wx.CheckBox(panel, -1, "Create numpy data")
         sizer.Add(self.doNumpy, 0, wx.ALIGN_CENTER | wx.ALIGN_CENTER_VERTICAL)
 
         self.doMATLAB = wx.CheckBox(panel, -1, "Create MATLAB data")
         sizer.Add(self.doMATLAB, 0, wx.ALIGN_CENTER | wx.ALIGN_CENTER_VERTICAL)
 
+        self.doHDF5 = wx.CheckBox(panel, -1, "Create HDF5 data")
+        sizer.Add(self.doHDF5, 0, wx.ALIGN_CENTER | wx.ALIGN_CENTER_VERTICAL)
+        #h5py is optional; without it there is no HDF5 or MATLAB v7.3 output to offer
+        if hdf5export.h5py is None:
+            self.doHDF5.Disable()
+            self.doHDF5.SetToolTip("HDF5 output needs the h5py package")
+
+        self.keepPrecision = wx.CheckBox(panel, -1, "Keep file precision")
+        sizer.Add(self.keepPrecision, 0, wx.ALIGN_CENTER | wx.ALIGN_CENTER_VERTICAL | wx.TOP, 10)
+
         sizer.Add(wx.StaticLine(panel, -1), 0, wx.EXPAND | wx.TOP, 18)
 
         ins = wx.StaticText(panel, -1, "Drop OOMMF Files Here!")
@@ -130,25 +144,49 @@ class MainFrame(wx.Frame):
         global LASTPATH
         #Outputs are array, headers, filenam
         if self.doNumpy.GetValue():
-            with wx.FileDialog(self, 'Export Pickled numpy Data',
-                               LASTPATH, "", "Pickled Data (*.pnp)|*.pnp",
+            with wx.FileDialog(self, 'Export numpy Data', LASTPATH, "",
+                               "numpy Array (*.npy)|*.npy|Pickled Data (*.pnp)|*.pnp",
                                wx.FD_SAVE) as dlg:
-                if dlg.ShowModal() == wx.ID_OK and dlg.GetFilename():
+                res = dlg.ShowModal()
+                if res == wx.ID_OK and dlg.GetFilename():
                     filename = dlg.GetPath()
                     LASTPATH = os.path.dirname(filename)
-                    oommfdecode.pickleArray(data, headers, extraData, filename)
-                elif dlg.ShowModal() == wx.ID_CANCEL:
+                    #Plain .npy (plus a .json of the headers) can be memory-mapped back in
+                    if dlg.GetFilterIndex() == 0:
+                        oommfdecode.npyArray(data, headers, extraData, filename)
+                    else:
+                        oommfdecode.pickleArray(data, headers, extraData, filename)
+                elif res == wx.ID_CANCEL:
                     return # the user changed their mind
 
         if self.doMATLAB.GetValue():
-            with wx.FileDialog(self, 'Export MATLAB Data', LASTPATH, "",
-                               "MATLAB Data (*.mat)|*.mat",
+            wildcard = "MATLAB Data (*.mat)|*.mat"
+            if hdf5export.h5py is not None:
+                wildcard += "|MATLAB v7.3 Data, for large runs (*.mat)|*.mat"
+            with wx.FileDialog(self, 'Export MATLAB Data', LASTPATH, "", wildcard,
+                               wx.FD_SAVE) as dlg:
+                res = dlg.ShowModal()
+                if res == wx.ID_OK and dlg.GetFilename():
+                    filename = dlg.GetPath()
+                    LASTPATH = os.path.dirname(filename)
+                    #v7.3 is HDF5 underneath, written a frame at a time with no 2 GB limit
+                    if dlg.GetFilterIndex() == 1:
+                        hdf5export.matlab73Array(data, headers, extraData, filename)
+                    else:
+                        oommfdecode.matlabifyArray(data, headers, extraData, filename)
+                elif res == wx.ID_CANCEL:
+                    return # the user changed their mind
+
+        if self.doHDF5.GetValue():
+            with wx.FileDialog(self, 'Export HDF5 Data', LASTPATH, "",
+                               "HDF5 Data (*.h5)|*.h5",
                                wx.FD_SAVE) as dlg:
-                if dlg.ShowModal() == wx.ID_OK and dlg.GetFilename():
+                res = dlg.ShowModal()
+                if res == wx.ID_OK and dlg.GetFilename():
                     filename = dlg.GetPath()
                     LASTPATH = os.path.dirname(filename)
-                    oommfdecode.matlabifyArray(data, headers, extraData, filename)
-                elif dlg.ShowModal() == wx.ID_CANCEL:
+                    hdf5export.hdf5Array(data, headers, extraData, filename)
+                elif res == wx.ID_CANCEL:
                     return # the user changed their mind
 
     def showAbout(self, evt):
@@ -205,22 +243,20 @@ class OOMMFSelectiveTarget(wx.FileDropTarget):
     def OnDropFiles(self, x, y, filenames):
         """
         """
-        oommf = filterOnExtensions(["omf", "ovf", "oef", "ohf"], filenames)
-        if not oommf or not (self.parent.doNumpy.GetValue() or self.parent.doMATLAB.GetValue()):
+        #Compressed files (.omf.gz and so on) are decoded without unpacking them first
+        oommf = [name for name in filenames if oommfdecode.isOVFName(name)]
+        if not oommf or not (self.parent.doNumpy.GetValue() or self.parent.doMATLAB.GetValue()
+                         or self.parent.doHDF5.GetValue()):
             return 0 #You got dropped some bad files!
         global LASTPATH
         LASTPATH = os.path.dirname(oommf[0])
-        arrays, headers, extra = self.groupUnpack(oommf,
-                                             SupportDialog("Decode in Progress",
-                                                           "Decoding...",
-                                                           maximum=len(oommf)))
-
-        #One final step before we're done - let's try to sort based on the sim time
-        #using a standard decorate-sort-undecorate, with a twist for the variable number of keys
-
-        #Let's start by finding the original indices - making a copy is key
-
-        arrays, extra = oommfdecode.sortBySimTime(extra, arrays)
+        decoded = self.groupUnpack(oommf,
+                                   SupportDialog("Decode in Progress",
+                                                 "Decoding...",
+                                                 maximum=len(oommf)))
+        if decoded is None:
+            return 0 #Already reported
+        arrays, headers, extra = decoded
 
         self.parent.gatherData(arrays, headers, extra)
         return 1
@@ -229,15 +265,25 @@ class OOMMFSelectiveTarget(wx.FileDropTarget):
     def groupUnpack(self, targetlist, progdialog=None):
         """
         """
-        try:
-            (decodedArrays, headers, extraData) = oommfdecode.groupUnpack(targetlist)
+        #Binary 4 files stay float32 end to end if asked, halving memory and output size
+        dtype = "native" if self.parent.keepPrecision.GetValue() else np.float64
+        def progress(index, filename):
             if progdialog:
                 progdialog.workDone(1, "Decoding...")
-                time.sleep(0.01) #Should facilitate redraw thread coming to life
+        try:
+            #Settle the time order from the headers first, so every frame is decoded
+            #straight into its final slot and nothing is reshuffled afterwards
+            targetlist = oommfdecode.orderByHeaders(targetlist)
+            (decodedArrays, headers, extraData) = oommfdecode.groupUnpack(targetlist,
+                                                                          workers=DECODE_WORKERS,
+                                                                          progress=progress,
+                                                                          dtype=dtype,
+                                                                          memoryBudget=DECODE_MEMORY_BUDGET)
         except Exception as e:
             if progdialog: progdialog.finish()
             wx.MessageBox('Unpacking error: ' + repr(e), "Error")
             print(e)
+            return None
         else:
             if progdialog: progdialog.finish()
         return (decodedArrays, headers, extraData)
@@ -2,6 +2,7 @@
 Main GUI that manages singleton instances of the other windows
 """
 from __future__ import absolute_import
+import multiprocessing
 import wx
 from wx import adv
 import oommfdecode
@@ -137,4 +138,6 @@ class MainFrame(wx.Frame):
 # MAIN #
 ########
 if __name__ == "__main__":
+    #ODTChomp batch mode spawns worker processes, which a frozen build must divert here
+    multiprocessing.freeze_support()
     main()
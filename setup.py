@@ -24,16 +24,19 @@ setup(
     author_email=about['__email__'],
     url=about['__uri__'],
     packages=['oommftools'],  # same as name
+    python_requires='>=3.6',
     setup_requires=['pytest-runner'],
     install_requires=['scipy', 'numpy', 'future', 'pytest'] + (
             ["wxpython"] if not sys.platform.startswith("linux") else []
             ),  # external packages as dependencies
+    extras_require={'hdf5': ['h5py'], 'xarray': ['xarray']},
     tests_require=['pytest', 'pytest-cov'],
     classifiers=[
                  'Operating System :: MacOS :: MacOS X',
                  'Operating System :: Microsoft :: Windows',
                  'Operating System :: POSIX',
-                 'Programming Language :: Python :: 2.7',
+                 'Programming Language :: Python :: 3',
+                 'Programming Language :: Python :: 3.6',
                  'Intended Audience :: Science/Research',
                  'Topic :: Scientific/Engineering :: Physics',
                  'Topic :: Scientific/Engineering :: Visualization',
@@ -0,0 +1,130 @@
+import sys, os
+import shutil
+import tempfile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+sys.path.insert(0, PROJECT_DIR)
+
+import unittest
+import numpy as np
+import oommftools.core.oommfdecode as oommfdecode
+from oommftools.core.decodecache import DecodeCache
+
+
+class Test_DecodeCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.work_dir = tempfile.mkdtemp()
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.vector_file_binary = os.path.join(self.work_dir, 'h2h_leftedge_40x4.ohf')
+        shutil.copy(os.path.join(self.test_files_folder, 'h2h_leftedge_40x4.ohf'),
+                    self.vector_file_binary)
+        self.vector_file_text = os.path.join(self.test_files_folder,
+                                        'dw_edgefield_cut_cell4_160.ohf')
+        self.target = np.load(os.path.join(self.test_files_folder,
+                                        'targetarray_binary.npy'))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.work_dir)
+
+    def test_cache_miss_then_hit(self):
+        cache = DecodeCache(self.cache_dir)
+        first = cache.unpackFile(self.vector_file_binary)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        second = cache.unpackFile(self.vector_file_binary)
+        np.testing.assert_array_equal(second[0], self.target)
+        self.assertEqual(second[1], first[1])
+        self.assertEqual(second[2], first[2])
+
+    def test_cache_matches_unpackFile(self):
+        cache = DecodeCache(self.cache_dir)
+        cache.unpackFile(self.vector_file_text)
+        (targetarray, headers, extraCaptures) = cache.unpackFile(self.vector_file_text)
+        expected = oommfdecode.unpackFile(self.vector_file_text)
+        np.testing.assert_array_equal(targetarray, expected[0])
+        self.assertEqual(headers, expected[1])
+        self.assertEqual(extraCaptures, expected[2])
+
+    def test_cache_mmap_hit(self):
+        cache = DecodeCache(self.cache_dir)
+        cache.unpackFile(self.vector_file_binary, mmap=True)
+        (targetarray, headers, extraCaptures) = cache.unpackFile(self.vector_file_binary, mmap=True)
+        self.assertIsInstance(targetarray, np.memmap)
+        np.testing.assert_array_equal(targetarray, self.target)
+
+    def test_cache_out(self):
+        cache = DecodeCache(self.cache_dir)
+        cache.unpackFile(self.vector_file_binary)
+        out = np.zeros((160, 40, 4, 3))
+        (targetarray, headers, extraCaptures) = cache.unpackFile(self.vector_file_binary, out=out)
+        self.assertIs(targetarray, out)
+        np.testing.assert_array_equal(out, self.target)
+
+    def test_cache_changed_source_misses(self):
+        cache = DecodeCache(self.cache_dir)
+        key = cache.key(self.vector_file_binary, {})
+        cache.unpackFile(self.vector_file_binary)
+        stat = os.stat(self.vector_file_binary)
+        os.utime(self.vector_file_binary, (stat.st_atime, stat.st_mtime + 10))
+        self.assertNotEqual(cache.key(self.vector_file_binary, {}), key)
+        self.assertEqual(cache.validate(), 1)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_cache_validate_keeps_current(self):
+        cache = DecodeCache(self.cache_dir)
+        cache.unpackFile(self.vector_file_binary)
+        self.assertEqual(cache.validate(), 0)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_cache_eviction(self):
+        cache = DecodeCache(self.cache_dir, maxBytes=700000)
+        cache.unpackFile(self.vector_file_binary)
+        cache.unpackFile(self.vector_file_binary, mmap=True)
+        self.assertLessEqual(cache.size(), 700000)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_cache_clear(self):
+        cache = DecodeCache(self.cache_dir)
+        cache.unpackFile(self.vector_file_binary)
+        cache.clear()
+        self.assertEqual(cache.size(), 0)
+
+    def test_groupUnpack_with_cache(self):
+        cache = DecodeCache(self.cache_dir)
+        targets = [self.vector_file_binary] * 2
+        oommfdecode.groupUnpack(targets, cache=cache)
+        (arrays, headers, extraData) = oommfdecode.groupUnpack(targets, workers=2, cache=cache)
+        np.testing.assert_array_equal(arrays[1], self.target)
+        self.assertEqual(extraData['SimTime'], [0.0, 0.0])
+
+    def test_cache_one_entry_per_decode(self):
+        cache = DecodeCache(self.cache_dir)
+        cache.unpackFile(self.vector_file_binary)
+        cache.unpackFile(self.vector_file_binary, dtype=np.dtype('float64'))
+        cache.unpackFile(self.vector_file_binary, dtype='f8', mmap=True)
+        cache.unpackFile(self.vector_file_binary, dtype='native')
+        oommfdecode.groupUnpack([self.vector_file_binary] * 2, workers=2, useProcesses=True,
+                                cache=cache)
+        list(oommfdecode.iterUnpack([self.vector_file_binary], cache=cache))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        cache.unpackFile(self.vector_file_binary, dtype=np.float32)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 4)
+
+    def test_cache_mmap_miss(self):
+        cache = DecodeCache(self.cache_dir)
+        (targetarray, headers, extraCaptures) = cache.unpackFile(self.vector_file_binary, mmap=True)
+        self.assertIsInstance(targetarray, np.memmap)
+        self.assertEqual(targetarray.dtype, np.float64)
+        np.testing.assert_array_equal(targetarray, self.target)
+
+    def test_cache_overwrites_stale_array(self):
+        cache = DecodeCache(self.cache_dir)
+        key = cache.key(self.vector_file_binary, {})
+        np.save(cache._array(key), np.zeros(3))
+        (targetarray, headers, extraCaptures) = cache.unpackFile(self.vector_file_binary)
+        np.testing.assert_array_equal(cache.unpackFile(self.vector_file_binary)[0], self.target)
+        cache._remove(key)
+        cache._remove(key)
+        self.assertEqual(os.listdir(self.cache_dir), [])
@@ -0,0 +1,97 @@
+import sys, os
+import shutil
+import tempfile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+sys.path.insert(0, PROJECT_DIR)
+
+import unittest
+import numpy as np
+import oommftools.core.oommfdecode as oommfdecode
+from oommftools.core.framecollection import FrameCollection
+
+try:
+    import xarray
+except ImportError:
+    xarray = None
+
+
+class Test_FrameCollection(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.fields = {'xbase': 0.5, 'ybase': 1.5, 'zbase': 2.5,
+                       'xstepsize': 1.0, 'ystepsize': 3.0, 'zstepsize': 5.0,
+                       'Iteration': 7}
+        self.frames = []
+        self.targets = []
+        for n in range(5):
+            frame = np.arange(24, dtype=float).reshape((4, 3, 2, 1)) + n
+            target = os.path.join(self.work_dir, 'frame%d.ovf' % n)
+            oommfdecode.writeOVF(target, frame, dict(self.fields, SimTime=n * 1e-9), version=2)
+            self.frames.append(frame)
+            self.targets.append(target)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_lazy_indexing(self):
+        run = FrameCollection(self.targets, maxFrames=2)
+        self.assertEqual(run.shape, (5, 4, 3, 2, 1))
+        self.assertEqual(len(run), 5)
+        self.assertEqual(len(run.frames), 0)
+        np.testing.assert_array_equal(run[3], self.frames[3])
+        self.assertEqual(run[-1, 2, 1, 0, 0], self.frames[4][2, 1, 0, 0])
+        np.testing.assert_array_equal(run[1:4, 0], np.array(self.frames[1:4])[:, 0])
+        np.testing.assert_array_equal(run[[0, 2]], np.array(self.frames)[[0, 2]])
+        np.testing.assert_array_equal(np.asarray(run), np.array(self.frames))
+        self.assertEqual(run[5:].shape, (0, 4, 3, 2, 1))
+
+    def test_lru(self):
+        run = FrameCollection(self.targets, maxFrames=2)
+        run[0]
+        run[1]
+        run[0]
+        run[2]
+        self.assertEqual(list(run.frames), [0, 2])
+        self.assertIs(run.frame(2), run.frame(2))
+
+    def test_frames_read_only(self):
+        run = FrameCollection(self.targets)
+        with self.assertRaises(ValueError):
+            run[0][...] *= 0
+        with self.assertRaises(ValueError):
+            run[0, :, :, 0][...] = 1
+        np.testing.assert_array_equal(run[0], self.frames[0])
+        copy = run[0:1]
+        copy *= 0
+        np.testing.assert_array_equal(run[0], self.frames[0])
+
+    def test_coords(self):
+        run = FrameCollection(self.targets)
+        coords = run.coords()
+        np.testing.assert_array_equal(coords['x'], [0.5, 1.5, 2.5, 3.5])
+        np.testing.assert_array_equal(coords['y'], [1.5, 4.5, 7.5])
+        np.testing.assert_array_equal(coords['z'], [2.5, 7.5])
+        np.testing.assert_array_equal(coords['time'], np.arange(5) * 1e-9)
+        np.testing.assert_array_equal(coords['Iteration'], [7] * 5)
+        np.testing.assert_array_equal(coords['component'], [0])
+
+    def test_vector_components(self):
+        vector_file_binary = os.path.join(TEST_DIR, 'testfiles', 'h2h_leftedge_40x4.ohf')
+        run = FrameCollection([vector_file_binary])
+        np.testing.assert_array_equal(run.coords()['component'], ['x', 'y', 'z'])
+
+    def test_empty(self):
+        with self.assertRaises(Exception):
+            FrameCollection([])
+
+    @unittest.skipUnless(xarray, "xarray is not installed")
+    def test_toXarray(self):
+        dataset = FrameCollection(self.targets).toXarray()
+        data = dataset['OOMMFData']
+        self.assertEqual(data.dims, ('time', 'x', 'y', 'z', 'component'))
+        np.testing.assert_array_equal(data.values, np.array(self.frames))
+        self.assertEqual(float(data.sel(time=2e-9, x=1.5, y=4.5, z=7.5, component=0)),
+                         self.frames[2][1, 1, 1, 0])
+        self.assertEqual(dataset.attrs['xstepsize'], 1.0)
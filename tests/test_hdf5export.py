@@ -0,0 +1,121 @@
+import sys, os
+import shutil
+import tempfile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+sys.path.insert(0, PROJECT_DIR)
+
+import unittest
+import numpy as np
+import oommftools.core.oommfdecode as oommfdecode
+import oommftools.core.hdf5export as hdf5export
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+@unittest.skipUnless(h5py, "h5py is not installed")
+class Test_hdf5export(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.outfile = os.path.join(self.work_dir, 'out.h5')
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.vector_file_binary = os.path.join(self.test_files_folder,
+                                        'h2h_leftedge_40x4.ohf')
+        self.vector_file_text = os.path.join(self.test_files_folder,
+                                        'dw_edgefield_cut_cell4_160.ohf')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_hdf5Array_stack(self):
+        targets = [self.vector_file_binary] * 2
+        (arrays, headers, extraData) = oommfdecode.groupUnpack(targets)
+        hdf5export.hdf5Array(arrays, headers, extraData, self.outfile)
+        with h5py.File(self.outfile, 'r') as f:
+            self.assertEqual(f['OOMMFData'].chunks, (1, 160, 40, 4, 3))
+            self.assertEqual(f['OOMMFData'].compression, 'gzip')
+            np.testing.assert_array_equal(f['OOMMFData'][1], arrays[1])
+            np.testing.assert_array_equal(f['SimTime'][...], [0.0, 0.0])
+            self.assertEqual(f['MIFSource'].asstr()[0], extraData['MIFSource'][0])
+            self.assertEqual(f.attrs['xstepsize'], headers['xstepsize'])
+
+    def test_hdf5Array_single_frame(self):
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_text)
+        hdf5export.hdf5Array(array, headers, extraCaptures, self.outfile, dtype=np.float32,
+                             compression=None, chunking="slab")
+        with h5py.File(self.outfile, 'r') as f:
+            self.assertEqual(f['OOMMFData'].shape, (1,) + array.shape)
+            self.assertEqual(f['OOMMFData'].dtype, np.float32)
+            self.assertEqual(f['OOMMFData'].chunks, (1,) + array.shape[:2] + (1, 3))
+            self.assertEqual(f['OOMMFData'].compression, None)
+            np.testing.assert_array_equal(f['OOMMFData'][0], array.astype(np.float32))
+
+    def test_hdf5Files(self):
+        targets = [self.vector_file_binary, self.vector_file_binary]
+        seen = []
+        hdf5export.hdf5Files(targets, self.outfile, progress=lambda i, name: seen.append(i))
+        self.assertEqual(seen, [0, 1])
+        (arrays, headers, extraData) = oommfdecode.groupUnpack(targets)
+        with h5py.File(self.outfile, 'r') as f:
+            np.testing.assert_array_equal(f['OOMMFData'][...], arrays)
+            np.testing.assert_array_equal(f['Iteration'][...], extraData['Iteration'])
+
+    def test_bad_chunking(self):
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary)
+        with self.assertRaises(Exception):
+            hdf5export.hdf5Array(array, headers, extraCaptures, self.outfile, chunking="row")
+
+
+@unittest.skipUnless(h5py, "h5py is not installed")
+class Test_matlab73export(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.outfile = os.path.join(self.work_dir, 'out.mat')
+        self.vector_file_binary = os.path.join(TEST_DIR, 'testfiles', 'h2h_leftedge_40x4.ohf')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_matlab73Array(self):
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([self.vector_file_binary] * 2)
+        hdf5export.matlab73Array(arrays, headers, extraData, self.outfile)
+        with open(self.outfile, 'rb') as f:
+            header = f.read(128)
+        self.assertTrue(header.startswith(b'MATLAB 7.3 MAT-file'))
+        self.assertEqual(header[124:], b'\x00\x02IM')
+        with h5py.File(self.outfile, 'r') as f:
+            data = f['OOMMFData']
+            self.assertEqual(data.shape, (3, 4, 40, 160, 2))
+            self.assertEqual(data.chunks, (3, 4, 40, 160, 1))
+            self.assertEqual(data.attrs['MATLAB_class'], b'double')
+            np.testing.assert_array_equal(data[...].T, arrays)
+            np.testing.assert_array_equal(f['GridSize'][...], [[1e-08], [1e-08], [1e-08]])
+            self.assertEqual(f['SimTime'].shape, (2, 1))
+            mif = f['MIFSource']
+            self.assertEqual(mif.attrs['MATLAB_class'], b'char')
+            self.assertEqual(''.join(chr(c) for c in mif[:, 0]), extraData['MIFSource'][0])
+
+    def test_matlab73Files_single(self):
+        hdf5export.matlab73Files([self.vector_file_binary], self.outfile, dtype=np.float32)
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary)
+        with h5py.File(self.outfile, 'r') as f:
+            self.assertEqual(f['OOMMFData'].attrs['MATLAB_class'], b'single')
+            np.testing.assert_array_equal(f['OOMMFData'][..., 0].T, array.astype(np.float32))
+            self.assertEqual(f['Stage'].shape, (1, 1))
+
+    def test_matlab73_empty_strings(self):
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary)
+        extraCaptures = dict(extraCaptures, MIFSource="")
+        hdf5export.matlab73Array(np.array([array] * 2), headers,
+                                 dict((key, [value] * 2) for key, value in list(extraCaptures.items())),
+                                 self.outfile)
+        with h5py.File(self.outfile, 'r') as f:
+            mif = f['MIFSource']
+            self.assertEqual(mif.attrs['MATLAB_class'], b'char')
+            self.assertEqual(mif.attrs['MATLAB_empty'], 1)
+            self.assertEqual(mif.dtype, np.uint64)
+            np.testing.assert_array_equal(mif[...], [2, 0])
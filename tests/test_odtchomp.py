@@ -252,6 +252,100 @@ class Test_chomp(unittest.TestCase):
         test_output = "9"
         self.assertEqual(str(chomper.getDataLength()), test_output)
 
+    def test_chomp_multiple_blocks(self):
+        with tempfile.NamedTemporaryFile(delete=False) as temp:
+            temp.write(b"# ODT 1.0\n# Table Start\n# Columns: {Oxs_A::a} {Oxs_A::b}\n"
+                       b"  1  2\n  3  4\n\n# Table End\n# Table Start\n"
+                       b"# Columns: Oxs_A::b Oxs_A::c\n  6  7\n  5\n# Table End\n")
+        chomper = odtchomp.chomp(temp.name)
+        os.remove(temp.name)
+        self.assertEqual(chomper.getNames(), ['b', 'c'])
+        np.testing.assert_array_equal(chomper.getData()['a'], [1., 3.])
+        np.testing.assert_array_equal(chomper.getData()['b'], [2., 4., 6., 5.])
+        np.testing.assert_array_equal(chomper.getData()['c'], [7.])
+
+    def test_chomp_multiline_values(self):
+        chomper = odtchomp.chomp(self.temp_multiline.name)
+        np.testing.assert_array_equal(chomper.getData()['Iteration'], np.arange(9.))
+        self.assertEqual(chomper.getData()['mz'][-1], 0.093469568768023481)
+
+    def test_iterBlocks_small_chunks(self):
+        chomper = odtchomp.chomp(self.temp_multiline.name)
+        columns = {}
+        for headers, block in odtchomp.iterBlocks(self.temp_multiline.name, chunkBytes=100):
+            for key, values in block.items():
+                columns.setdefault(key, []).append(values)
+        self.assertGreater(len(columns['Oxs_MinDriver::mz']), 1)
+        np.testing.assert_array_equal(np.concatenate(columns['Oxs_MinDriver::mz']),
+                                      chomper.getData()['mz'])
+        self.assertEqual(odtchomp.list_prettify(headers), chomper.getNames())
+
+    def test_chomp_progress(self):
+        class Parent(object):
+            def progstart(self, total):
+                self.total = total
+                self.reports = []
+            def progreport(self, done):
+                self.reports.append(done)
+        parent = Parent()
+        odtchomp.chomp(self.temp_multiline.name, parent)
+        self.assertEqual(parent.total, os.path.getsize(self.temp_multiline.name))
+        self.assertEqual(parent.reports[-1], parent.total)
+
+    def test_scanColumns(self):
+        names = odtchomp.scanColumns(self.temp.name)
+        self.assertEqual(len(names), 15)
+        self.assertEqual(odtchomp.prettyNames(names)['Oxs_TimeDriver::Simulation time'],
+                         'Simulation time')
+
+    def test_convert(self):
+        outfile = tempfile.mkstemp()[1]
+        odtchomp.convert(self.temp_multiline.name, outfile, ",", ['Iteration', 'mz'])
+        with open(outfile) as f:
+            lines = f.read().splitlines()
+        os.remove(outfile)
+        chomper = odtchomp.chomp(self.temp_multiline.name)
+        self.assertEqual(lines[0], 'Iteration, mz')
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[-1], '%s, %s' % (chomper.getData()['Iteration'][-1],
+                                                 chomper.getData()['mz'][-1]))
+
+    def test_convert_missing_column(self):
+        with self.assertRaises(Exception):
+            odtchomp.convert(self.temp.name, os.devnull, ",", ['No such column'])
+
+    def test_chomp_columns(self):
+        full = odtchomp.chomp(self.temp_multiline.name)
+        chomper = odtchomp.chomp(self.temp_multiline.name, columns=['mz', 'Iteration'])
+        self.assertEqual(chomper.getNames(), ['mz', 'Iteration'])
+        self.assertEqual(sorted(chomper.getData().keys()), ['Iteration', 'mz'])
+        for name in ['mz', 'Iteration']:
+            np.testing.assert_array_equal(chomper.getData()[name], full.getData()[name])
+
+    def test_chomp_columns_missing(self):
+        with self.assertRaises(Exception):
+            odtchomp.chomp(self.temp.name, columns=['No such column'])
+
+    def test_batchConvert(self):
+        outdir = tempfile.mkdtemp()
+        seen = []
+        for workers, useProcesses in ((1, False), (2, False), (2, True)):
+            errors = odtchomp.batchConvert([self.temp_multiline.name, self.temp.name], ",",
+                                           ['Iteration', 'Bx'], workers=workers,
+                                           useProcesses=useProcesses,
+                                           outputDir=outdir,
+                                           progress=lambda i, fname, error: seen.append(i))
+            #temp has no Bx column, but temp_multiline is still converted
+            self.assertEqual(list(errors.keys()), [self.temp.name])
+            outfile = odtchomp.batchOutputName(self.temp_multiline.name, outdir)
+            with open(outfile) as f:
+                lines = f.read().splitlines()
+            os.remove(outfile)
+            self.assertEqual(lines[0], 'Iteration, Bx')
+            self.assertEqual(len(lines), 10)
+        os.rmdir(outdir)
+        self.assertEqual(sorted(seen), [0, 0, 0, 1, 1, 1])
+
     def test_chomp_absolute_path(self):
         """
         There seemed to be a problem with loading files from abolute path
@@ -296,7 +390,7 @@ class Test_write(unittest.TestCase):
         
     def test_write_outfile(self):
         """
-        Not sure if this is dropping a line from the end...
+        Every row is written, the last one included
         """
         outfile = tempfile.mkstemp()[1]
         # NOTE: Alternatively, for Python 2.6+, you can use
@@ -305,7 +399,27 @@ class Test_write(unittest.TestCase):
         odtchomp.write(outfile, self.interpreter, ",", ["key1 part1 part2", "key2 part1 part2", "key3 part1 part2"])
         with open(outfile) as f:
             content = f.read()
-        self.assertEqual(content, "key1 part1 part2, key2 part1 part2, key3 part1 part2\n1, 4, 7\n2, 5, 8\n")
+        self.assertEqual(content, "key1 part1 part2, key2 part1 part2, key3 part1 part2\n1, 4, 7\n2, 5, 8\n3, 6, 9\n")
+
+    def test_write_fmt(self):
+        outfile = tempfile.mkstemp()[1]
+        interpreter = odtchomp.Interpreter({'a': np.array([0.5, 1e-9]), 'b': np.array([2.0, 3.0])},
+                                           ['a', 'b'])
+        odtchomp.write(outfile, interpreter, "\t", ['a', 'b'], fmt="%.3e")
+        with open(outfile) as f:
+            content = f.read()
+        os.remove(outfile)
+        self.assertEqual(content, "a\tb\n5.000e-01\t2.000e+00\n1.000e-09\t3.000e+00\n")
+
+    def test_write_many_rows(self):
+        outfile = tempfile.mkstemp()[1]
+        values = np.random.rand(odtchomp.WRITE_ROWS + 10)
+        interpreter = odtchomp.Interpreter({'a': values, 'b': values * 2}, ['a', 'b'])
+        odtchomp.write(outfile, interpreter, ",", ['a', 'b'])
+        written = np.loadtxt(outfile, delimiter=",", skiprows=1)
+        os.remove(outfile)
+        np.testing.assert_array_equal(written[:, 0], values)
+        np.testing.assert_array_equal(written[:, 1], values * 2)
         
 class Test_resolve(unittest.TestCase):
     """
@@ -2,6 +2,13 @@ from future import standard_library
 standard_library.install_aliases()
 import sys, os
 import io
+import gzip
+import bz2
+import lzma
+import tarfile
+import zipfile
+import pathlib
+import shutil
 import tempfile
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -76,6 +83,500 @@ class Test_oommfdecode_binary(unittest.TestCase):
         self.assertEqual(extraCaptures, self.extraCaptures_test)
         
         
+class Test_oommfdecode_binary_4(unittest.TestCase):
+    """
+    Binary 4 variants of the binary fixture, written to a temporary file
+    with either byte order.
+    """
+    def setUp(self):
+        self.test_files_folder = 'testfiles'
+        self.vector_file_binary = os.path.join(TEST_DIR,
+                                        self.test_files_folder,
+                                        'h2h_leftedge_40x4.ohf')
+        self.targetarray_pickle = os.path.join(TEST_DIR,
+                                        self.test_files_folder,
+                                        'targetarray_binary.npy')
+        with open(self.vector_file_binary, 'rb') as f:
+            self.header = f.read().split(b'# Begin: Data Binary 8\n')[0]
+        self.target = np.load(self.targetarray_pickle)
+
+    def write_binary_4(self, endian):
+        data = self.target.transpose(2, 1, 0, 3).astype(endian + 'f4').tobytes()
+        filename = os.path.join(tempfile.gettempdir(), 'test_binary_4.ohf')
+        with open(filename, 'wb') as f:
+            f.write(self.header)
+            f.write(b'# Begin: Data Binary 4\n')
+            f.write(struct.pack(endian + 'f', 1234567.0))
+            f.write(data)
+            f.write(b'\n# End: Data Binary 4\n# End: Segment\n')
+        return filename
+
+    def test_unpackFile_binary_4_little(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.write_binary_4('<'))
+        np.testing.assert_array_equal(targetarray, self.target.astype(np.float32))
+
+    def test_unpackFile_binary_4_big(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.write_binary_4('>'))
+        np.testing.assert_array_equal(targetarray, self.target.astype(np.float32))
+
+    def test_unpackFile_binary_4_dtype(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.write_binary_4('<'))
+        self.assertEqual(targetarray.dtype, np.float64)
+
+    def test_unpackFile_binary_4_native(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.write_binary_4('>'), dtype="native")
+        self.assertEqual(targetarray.dtype, np.float32)
+        np.testing.assert_array_equal(targetarray, self.target.astype(np.float32))
+
+    def test_unpackFile_binary_8_native(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, dtype="native")
+        self.assertEqual(targetarray.dtype, np.float64)
+
+    def test_unpackFile_force_float32(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, dtype=np.float32)
+        self.assertEqual(targetarray.dtype, np.float32)
+        np.testing.assert_array_equal(targetarray, self.target.astype(np.float32))
+
+    def test_unpackFile_unsupported_dtype(self):
+        with self.assertRaises(Exception):
+            oommfdecode.unpackFile(self.vector_file_binary, dtype=np.int16)
+
+    def test_groupUnpack_native(self):
+        filename = self.write_binary_4('<')
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([filename, filename], dtype="native")
+        self.assertEqual(arrays.dtype, np.float32)
+        self.assertEqual(arrays.shape, (2, 160, 40, 4, 3))
+
+class Test_unpackFile_mmap(unittest.TestCase):
+    def setUp(self):
+        self.test_files_folder = 'testfiles'
+        self.vector_file_binary = os.path.join(TEST_DIR,
+                                        self.test_files_folder,
+                                        'h2h_leftedge_40x4.ohf')
+        self.vector_file_text = os.path.join(TEST_DIR,
+                                        self.test_files_folder,
+                                        'dw_edgefield_cut_cell4_160.ohf')
+        self.target = np.load(os.path.join(TEST_DIR,
+                                        self.test_files_folder,
+                                        'targetarray_binary.npy'))
+
+    def test_unpackFile_mmap_binary(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, mmap=True)
+        self.assertEqual(targetarray.shape, (160, 40, 4, 3))
+        self.assertFalse(targetarray.flags.writeable)
+        np.testing.assert_array_equal(targetarray, self.target)
+        np.testing.assert_array_equal(targetarray[10:20, 5, 2], self.target[10:20, 5, 2])
+
+    def test_unpackFile_mmap_valuemultiplier(self):
+        with open(self.vector_file_binary, 'rb') as f:
+            content = f.read().replace(b'# valuemultiplier: 1\n', b'# valuemultiplier: 2\n')
+        filename = os.path.join(tempfile.gettempdir(), 'test_mmap_scaled.ohf')
+        with open(filename, 'wb') as f:
+            f.write(content)
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(filename, mmap=True)
+        self.assertIsInstance(targetarray, oommfdecode.ScaledArrayView)
+        self.assertEqual(targetarray.shape, (160, 40, 4, 3))
+        np.testing.assert_array_equal(targetarray[3, :, 1], 2 * self.target[3, :, 1])
+        np.testing.assert_array_equal(np.asarray(targetarray), 2 * self.target)
+
+    def test_unpackFile_mmap_text_falls_back(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_text, mmap=True)
+        self.assertIsInstance(targetarray, np.ndarray)
+        self.assertEqual(targetarray.shape, (1250, 40, 1, 3))
+
+class Test_unpackFile_ovf2(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work_dir, 'energy.oef')
+        self.fields = {'xbase': 0.5, 'ybase': 0.5, 'zbase': 0.5,
+                       'xstepsize': 1.0, 'ystepsize': 1.0, 'zstepsize': 1.0,
+                       'SimTime': 1e-09}
+        self.scalar = np.arange(24, dtype=float).reshape((4, 3, 2, 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def lower_case_data_lines(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data.replace(b'# Begin: Data Binary', b'# Begin: data binary')
+                        .replace(b'# Begin: Data Text', b'# begin: data text'))
+
+    def test_scalar_binary(self):
+        oommfdecode.writeOVF(self.filename, self.scalar, self.fields, "Binary 8", version=2)
+        self.lower_case_data_lines()
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.filename)
+        self.assertEqual(array.shape, (4, 3, 2, 1))
+        np.testing.assert_array_equal(array, self.scalar)
+        self.assertEqual(headers['valuedim'], 1.0)
+        self.assertEqual(extraCaptures['SimTime'], 1e-09)
+
+    def test_scalar_text(self):
+        oommfdecode.writeOVF(self.filename, self.scalar, self.fields, "Text", version=2)
+        self.lower_case_data_lines()
+        np.testing.assert_array_equal(oommfdecode.unpackFile(self.filename)[0], self.scalar)
+
+    def test_scalar_mmap_and_scan(self):
+        oommfdecode.writeOVF(self.filename, self.scalar, self.fields, "Binary 4", version=2)
+        fields = oommfdecode.scanHeaders(self.filename)
+        self.assertEqual(fields['DataFormat'], 'Binary 4')
+        self.assertEqual(fields['DataLength'], 4 * (1 + 24))
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.filename, mmap=True)
+        self.assertEqual(array.shape, (4, 3, 2, 1))
+        np.testing.assert_array_equal(array, self.scalar)
+
+    def test_scalar_groupUnpack(self):
+        oommfdecode.writeOVF(self.filename, self.scalar, self.fields, "Binary 8", version=2)
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([self.filename] * 2)
+        self.assertEqual(arrays.shape, (2, 4, 3, 2, 1))
+        np.testing.assert_array_equal(arrays[1], self.scalar)
+
+    def test_unknown_format(self):
+        oommfdecode.writeOVF(self.filename, self.scalar, self.fields, "Binary 8", version=2)
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data.replace(b'# Begin: Data Binary 8', b'# Begin: Data Binary 2'))
+        with self.assertRaises(Exception):
+            oommfdecode.unpackFile(self.filename)
+
+class Test_iterSegments(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work_dir, 'segments.ovf')
+        self.fields = {'xbase': 0.5, 'ybase': 0.5, 'zbase': 0.5,
+                       'xstepsize': 1.0, 'ystepsize': 1.0, 'zstepsize': 1.0}
+        self.frames = [np.arange(24, dtype=float).reshape((2, 2, 2, 3)) * (n + 1)
+                       for n in range(3)]
+        segments = []
+        for n, (frame, dataFormat) in enumerate(zip(self.frames, ["Binary 8", "Text", "Binary 4"])):
+            fields = dict(self.fields, SimTime=float(n))
+            part = os.path.join(self.work_dir, 'part.ovf')
+            oommfdecode.writeOVF(part, frame, fields, dataFormat)
+            with open(part, 'rb') as f:
+                segments.append(f.read())
+        with open(self.filename, 'wb') as f:
+            f.write(segments[0].replace(b'# Segment count: 1', b'# Segment count: 3'))
+            for segment in segments[1:]:
+                f.write(segment[segment.index(b'# Begin: Segment'):])
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_iterSegments(self):
+        segments = list(oommfdecode.iterSegments(self.filename))
+        self.assertEqual(len(segments), 3)
+        for n, (array, headers, extraCaptures) in enumerate(segments):
+            np.testing.assert_array_equal(array, self.frames[n])
+            self.assertEqual(extraCaptures['SimTime'], float(n))
+
+    def test_iterSegments_mmap(self):
+        segments = oommfdecode.iterSegments(self.filename, mmap=True, dtype="native")
+        for n, (array, headers, extraCaptures) in enumerate(segments):
+            np.testing.assert_array_equal(array, self.frames[n])
+        #Mapped views keep the file's own (big-endian) single precision
+        self.assertEqual(array.dtype, np.dtype('>f4'))
+        self.assertEqual(n, 2)
+
+    def test_iterSegments_single(self):
+        vector_file_binary = os.path.join(TEST_DIR, 'testfiles', 'h2h_leftedge_40x4.ohf')
+        segments = list(oommfdecode.iterSegments(vector_file_binary))
+        self.assertEqual(len(segments), 1)
+        np.testing.assert_array_equal(segments[0][0],
+                                      oommfdecode.unpackFile(vector_file_binary)[0])
+
+class Test_unpackFile_streams(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.names = ['h2h_leftedge_40x4.ohf', 'dw_edgefield_cut_cell4_160.ohf']
+        self.expected = {}
+        for name in self.names:
+            self.expected[name] = oommfdecode.unpackFile(os.path.join(self.test_files_folder, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def compress(self, name, opener, extension):
+        path = os.path.join(self.work_dir, name + '.' + extension)
+        with open(os.path.join(self.test_files_folder, name), 'rb') as f:
+            with opener(path, 'wb') as out:
+                out.write(f.read())
+        return path
+
+    def test_path_objects(self):
+        for name in self.names:
+            path = pathlib.Path(self.test_files_folder) / name
+            for mmap in (False, True):
+                (array, headers, extraCaptures) = oommfdecode.unpackFile(path, mmap=mmap)
+                np.testing.assert_array_equal(array, self.expected[name][0])
+            self.assertEqual(oommfdecode.scanHeaders(path)['xnodes'],
+                             self.expected[name][1]['xnodes'])
+            self.assertEqual(len(list(oommfdecode.iterSegments(path))), 1)
+            self.assertTrue(oommfdecode.isOVFName(path))
+        compressed = pathlib.Path(self.compress(self.names[0], gzip.open, 'gz'))
+        np.testing.assert_array_equal(oommfdecode.unpackFile(compressed, mmap=True)[0],
+                                      self.expected[self.names[0]][0])
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([compressed, compressed], workers=2)
+        np.testing.assert_array_equal(arrays[1], self.expected[self.names[0]][0])
+
+    def test_file_like(self):
+        for name in self.names:
+            with open(os.path.join(self.test_files_folder, name), 'rb') as f:
+                stream = io.BytesIO(f.read())
+            (array, headers, extraCaptures) = oommfdecode.unpackFile(stream, mmap=True)
+            np.testing.assert_array_equal(array, self.expected[name][0])
+            self.assertEqual(extraCaptures, self.expected[name][2])
+
+    def test_compressed(self):
+        for opener, extension in [(gzip.open, 'gz'), (bz2.open, 'bz2'), (lzma.open, 'xz')]:
+            path = self.compress(self.names[0], opener, extension)
+            (array, headers, extraCaptures) = oommfdecode.unpackFile(path, mmap=True)
+            self.assertIsInstance(array, np.ndarray)
+            np.testing.assert_array_equal(array, self.expected[self.names[0]][0])
+
+    def test_compressed_roi_and_scan(self):
+        path = self.compress(self.names[0], gzip.open, 'gz')
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(path, roi=(slice(0, 10),),
+                                                                 components=2)
+        np.testing.assert_array_equal(array, self.expected[self.names[0]][0][:10, :, :, 2:])
+        self.assertEqual(oommfdecode.scanHeaders(path)['xnodes'], 160.0)
+        self.assertEqual([os.path.basename(p) for p, f in oommfdecode.scanDirectory(self.work_dir)],
+                         ['h2h_leftedge_40x4.ohf.gz'])
+
+    def test_isOVFName(self):
+        self.assertTrue(oommfdecode.isOVFName('run/m0001.omf'))
+        self.assertTrue(oommfdecode.isOVFName('m0001.OVF.xz'))
+        self.assertFalse(oommfdecode.isOVFName('m0001.odt.gz'))
+        self.assertFalse(oommfdecode.isOVFName('omf'))
+
+    def test_iterArchive_tar(self):
+        gzipped = self.compress(self.names[1], gzip.open, 'gz')
+        archive = os.path.join(self.work_dir, 'run.tar.xz')
+        with tarfile.open(archive, 'w:xz') as tar:
+            tar.add(os.path.join(self.test_files_folder, self.names[0]), 'run/' + self.names[0])
+            tar.add(gzipped, 'run/' + self.names[1] + '.gz')
+            tar.add(os.path.join(self.test_files_folder, 'targetarray_binary.npy'), 'run/a.npy')
+        members = list(oommfdecode.iterArchive(archive))
+        self.assertEqual([m[0] for m in members],
+                         ['run/' + self.names[0], 'run/' + self.names[1] + '.gz'])
+        np.testing.assert_array_equal(members[0][1], self.expected[self.names[0]][0])
+        np.testing.assert_array_equal(members[1][1], self.expected[self.names[1]][0])
+
+    def test_iterArchive_zip(self):
+        archive = os.path.join(self.work_dir, 'run.zip')
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name in self.names:
+                z.write(os.path.join(self.test_files_folder, name), name)
+        for name, array, headers, extraCaptures in oommfdecode.iterArchive(archive):
+            np.testing.assert_array_equal(array, self.expected[name][0])
+
+class Test_scanHeaders(unittest.TestCase):
+    def setUp(self):
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.vector_file_binary = os.path.join(self.test_files_folder,
+                                        'h2h_leftedge_40x4.ohf')
+        self.vector_file_text = os.path.join(self.test_files_folder,
+                                        'dw_edgefield_cut_cell4_160.ohf')
+
+    def test_scanHeaders_binary(self):
+        fields = oommfdecode.scanHeaders(self.vector_file_binary)
+        self.assertEqual(fields['Title'], 'Oxs_Demag::Field')
+        self.assertEqual(fields['meshunit'], 'm')
+        self.assertEqual(fields['valueunit'], 'A/m')
+        self.assertEqual(fields['xnodes'], 160.0)
+        self.assertEqual(fields['ValueRangeMaxMag'], 349370.68189143512)
+        self.assertEqual(fields['MIFSource'], '/local/home/donahue/oommf/app/oxs/examples/h2h_edgefield.mif')
+        self.assertEqual(fields['SimTime'], 0.0)
+        self.assertEqual(fields['DataFormat'], 'Binary 8')
+        self.assertEqual(fields['DataLength'], 8 * (1 + 160 * 40 * 4 * 3))
+
+    def test_scanHeaders_data_offset(self):
+        fields = oommfdecode.scanHeaders(self.vector_file_binary)
+        with open(self.vector_file_binary, 'rb') as f:
+            f.seek(fields['DataOffset'])
+            self.assertEqual(struct.unpack('>d', f.read(8))[0], 123456789012345.0)
+
+    def test_scanHeaders_text(self):
+        fields = oommfdecode.scanHeaders(self.vector_file_text)
+        self.assertEqual(fields['DataFormat'], 'Text')
+        self.assertEqual(fields['DataLength'], None)
+        self.assertEqual(fields['valuemultiplier'], 258967.81743932367)
+
+    def test_scanHeaders_matches_unpackFile(self):
+        fields = oommfdecode.scanHeaders(self.vector_file_binary)
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary)
+        for key, value in list(headers.items()) + list(extraCaptures.items()):
+            self.assertEqual(fields[key], value)
+
+    def test_scanDirectory(self):
+        scanned = oommfdecode.scanDirectory(self.test_files_folder)
+        names = [os.path.basename(path) for path, fields in scanned]
+        self.assertEqual(names, ['dw_edgefield_cut_cell4_160.ohf',
+                                 'h2h_leftedge_40x4.ohf',
+                                 'yoyo_leftedge_15x5.ohf'])
+        self.assertEqual(scanned[2][1]['xnodes'], 500.0)
+
+class Test_groupUnpack(unittest.TestCase):
+    def setUp(self):
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.vector_file_binary = os.path.join(self.test_files_folder,
+                                        'h2h_leftedge_40x4.ohf')
+        self.vector_file_other = os.path.join(self.test_files_folder,
+                                        'yoyo_leftedge_15x5.ohf')
+        self.target = np.load(os.path.join(self.test_files_folder,
+                                        'targetarray_binary.npy'))
+
+    def test_groupUnpack(self):
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([self.vector_file_binary, self.vector_file_binary])
+        self.assertEqual(arrays.shape, (2, 160, 40, 4, 3))
+        np.testing.assert_array_equal(arrays[0], self.target)
+        np.testing.assert_array_equal(arrays[1], self.target)
+        self.assertEqual(headers['xnodes'], 160.0)
+        self.assertEqual(extraData['SimTime'], [0.0, 0.0])
+
+    def test_groupUnpack_memory_budget(self):
+        scratch = tempfile.mkdtemp()
+        try:
+            targets = [self.vector_file_binary] * 3
+            (arrays, headers, extraData) = oommfdecode.groupUnpack(targets, workers=2,
+                                                                   memoryBudget=1000000,
+                                                                   scratchDir=scratch)
+            self.assertIsInstance(arrays, np.memmap)
+            self.assertEqual(arrays.shape, (3, 160, 40, 4, 3))
+            for array in arrays:
+                np.testing.assert_array_equal(array, self.target)
+            filename = os.path.join(scratch, 'spilled.npy')
+            oommfdecode.pickleArray(arrays, headers, extraData, filename)
+            with open(filename, 'rb') as f:
+                self.assertNotIsInstance(pickle.load(f)[0], np.memmap)
+            oommfdecode.npyArray(arrays, headers, extraData, filename)
+            np.testing.assert_array_equal(np.load(filename)[2], self.target)
+            del arrays, array
+            self.assertEqual(sorted(os.listdir(scratch)), ['spilled.json', 'spilled.npy'])
+        finally:
+            shutil.rmtree(scratch)
+
+    def test_groupUnpack_within_budget(self):
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([self.vector_file_binary],
+                                                               memoryBudget=10 ** 7)
+        self.assertNotIsInstance(arrays, np.memmap)
+
+    def test_groupUnpack_threads(self):
+        targets = [self.vector_file_binary] * 4
+        (arrays, headers, extraData) = oommfdecode.groupUnpack(targets, workers=2)
+        self.assertEqual(arrays.shape, (4, 160, 40, 4, 3))
+        for array in arrays:
+            np.testing.assert_array_equal(array, self.target)
+        self.assertEqual(extraData, oommfdecode.groupUnpack(targets)[2])
+
+    def test_groupUnpack_processes(self):
+        targets = [self.vector_file_binary] * 3
+        (arrays, headers, extraData) = oommfdecode.groupUnpack(targets, workers=2, useProcesses=True)
+        for array in arrays:
+            np.testing.assert_array_equal(array, self.target)
+        self.assertEqual(headers['xnodes'], 160.0)
+        self.assertEqual(extraData['MIFSource'], ['/local/home/donahue/oommf/app/oxs/examples/h2h_edgefield.mif'] * 3)
+
+    def test_groupUnpack_progress(self):
+        reported = []
+        targets = [self.vector_file_binary] * 3
+        oommfdecode.groupUnpack(targets, workers=2, progress=lambda i, target: reported.append(i))
+        self.assertEqual(sorted(reported), [0, 1, 2])
+
+    def test_groupUnpack_processes_mismatched_grids(self):
+        with self.assertRaises(Exception):
+            oommfdecode.groupUnpack([self.vector_file_binary, self.vector_file_other], workers=2, useProcesses=True)
+
+    def test_groupUnpack_empty(self):
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([])
+        self.assertEqual(arrays.shape, (0,))
+        self.assertEqual(headers, {})
+
+    def test_groupUnpack_mismatched_grids(self):
+        with self.assertRaises(Exception):
+            oommfdecode.groupUnpack([self.vector_file_binary, self.vector_file_other])
+
+    def test_unpackFile_out(self):
+        out = np.zeros((160, 40, 4, 3))
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, out=out)
+        self.assertIs(targetarray, out)
+        np.testing.assert_array_equal(out, self.target)
+
+    def test_iterUnpack(self):
+        frames = list(oommfdecode.iterUnpack([self.vector_file_binary, self.vector_file_other]))
+        self.assertEqual(frames[0][0].shape, (160, 40, 4, 3))
+        self.assertEqual(frames[1][0].shape, (500, 6, 2, 3))
+        self.assertEqual(frames[1][2]['MIFSource'], 'yoyo_edgefield.mif')
+
+    def test_iterUnpack_reuse_buffer(self):
+        arrays = [frame[0] for frame in oommfdecode.iterUnpack([self.vector_file_binary, self.vector_file_binary], reuseBuffer=True)]
+        self.assertIs(arrays[0], arrays[1])
+        np.testing.assert_array_equal(arrays[1], self.target)
+
+class Test_unpackFile_roi(unittest.TestCase):
+    def setUp(self):
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.vector_file_binary = os.path.join(self.test_files_folder,
+                                        'h2h_leftedge_40x4.ohf')
+        self.vector_file_text = os.path.join(self.test_files_folder,
+                                        'dw_edgefield_cut_cell4_160.ohf')
+        self.target = np.load(os.path.join(self.test_files_folder,
+                                        'targetarray_binary.npy'))
+        self.target_text = np.load(os.path.join(self.test_files_folder,
+                                        'targetarray_text.npy'))
+
+    def test_unpackFile_roi_binary(self):
+        roi = (slice(10, 50, 4), slice(None, None, 2), 3)
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, roi=roi)
+        self.assertEqual(targetarray.shape, (10, 20, 1, 3))
+        np.testing.assert_array_equal(targetarray, self.target[10:50:4, ::2, 3:4])
+
+    def test_unpackFile_roi_text(self):
+        roi = (slice(100, 200), slice(0, 40, 8))
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_text, roi=roi)
+        np.testing.assert_array_equal(targetarray, self.target_text[100:200, 0:40:8])
+
+    def test_unpackFile_components(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, components=[0, 2])
+        self.assertEqual(targetarray.shape, (160, 40, 4, 2))
+        np.testing.assert_array_equal(targetarray, self.target[..., [0, 2]])
+
+    def test_unpackFile_single_component(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_text, components=1)
+        np.testing.assert_array_equal(targetarray, self.target_text[..., 1:2])
+
+    def test_unpackFile_roi_mmap(self):
+        (targetarray, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary, mmap=True, roi=(slice(0, 8), -1))
+        self.assertEqual(targetarray.shape, (8, 1, 4, 3))
+        np.testing.assert_array_equal(targetarray, self.target[0:8, -1:])
+
+    def test_unpackFile_roi_out(self):
+        out = np.zeros((160, 40, 1, 3), dtype=np.float32)
+        oommfdecode.unpackFile(self.vector_file_binary, roi=(None, None, 0), out=out)
+        np.testing.assert_array_equal(out, self.target[:, :, 0:1].astype(np.float32))
+
+    def test_groupUnpack_roi(self):
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([self.vector_file_binary] * 2,
+                                                               workers=2,
+                                                               roi=(slice(5, 10),),
+                                                               components=2)
+        self.assertEqual(arrays.shape, (2, 5, 40, 4, 1))
+        np.testing.assert_array_equal(arrays[1], self.target[5:10, ..., 2:3])
+
+    def test_probeSeries(self):
+        points = [(0, 0, 0), (159, 39, 3), (80, 20, 2)]
+        (series, extraData) = oommfdecode.probeSeries([self.vector_file_binary] * 3, points, components=[0, 1])
+        self.assertEqual(series.shape, (3, 3, 2))
+        for n, (i, j, k) in enumerate(points):
+            np.testing.assert_array_equal(series[2, n], self.target[i, j, k, :2])
+        self.assertEqual(extraData['SimTime'], [0.0, 0.0, 0.0])
+
+    def test_probeSeries_text(self):
+        (series, extraData) = oommfdecode.probeSeries([self.vector_file_text], [(3, 4, 0)])
+        np.testing.assert_array_equal(series[0, 0], self.target_text[3, 4, 0])
+
 class Test_pickleArray(unittest.TestCase):
     def setUp(self):
         self.array = np.array([1., 2., 3.])
@@ -90,7 +591,48 @@ class Test_pickleArray(unittest.TestCase):
             e = pickle.load(input_file)
         np.testing.assert_array_equal(e[0], np.array([1., 2., 3.]))
         self.assertEqual(e[1], dict(list(self.headers.items()) + list(self.extraCaptures.items())))
+
+    def test_pickle_array_dtype(self):
+        oommfdecode.pickleArray(self.array, self.headers, self.extraCaptures, self.filename, dtype=np.float32)
+        with open(self.filename, "rb") as input_file:
+            e = pickle.load(input_file)
+        self.assertEqual(e[0].dtype, np.float32)
  
+class Test_npyArray(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.headers = {'xstepsize': 1e-08, 'meshunit': 'm'}
+        self.filename = os.path.join(self.work_dir, 'test.npy')
+        self.vector_file_binary = os.path.join(TEST_DIR, 'testfiles', 'h2h_leftedge_40x4.ohf')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_npy_array(self):
+        (arrays, headers, extraData) = oommfdecode.groupUnpack([self.vector_file_binary] * 2)
+        oommfdecode.npyArray(arrays, headers, extraData, self.filename)
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, 'test.json')))
+        np.testing.assert_array_equal(np.load(self.filename, mmap_mode='r'), arrays)
+        (array, loadedHeaders, extra) = oommfdecode.loadNpyArray(self.filename)
+        self.assertIsInstance(array, np.memmap)
+        np.testing.assert_array_equal(array[1], arrays[1])
+        self.assertEqual(loadedHeaders, headers)
+        self.assertEqual(extra, extraData)
+
+    def test_npy_array_dtype(self):
+        oommfdecode.npyArray(np.array([1., 2., 3.]), self.headers, {'SimTime': [0.0]},
+                             self.filename, dtype=np.float32)
+        (array, headers, extra) = oommfdecode.loadNpyArray(self.filename, mmap=False)
+        self.assertEqual(array.dtype, np.float32)
+        self.assertNotIsInstance(array, np.memmap)
+        self.assertEqual(headers, self.headers)
+
+    def test_npy_array_other_extension(self):
+        filename = os.path.join(self.work_dir, 'test.frames')
+        oommfdecode.npyArray(np.array([1., 2., 3.]), self.headers, {}, filename)
+        self.assertEqual(sorted(os.listdir(self.work_dir)), ['test.frames', 'test.json'])
+        np.testing.assert_array_equal(oommfdecode.loadNpyArray(filename)[0], [1., 2., 3.])
+
 class Test_matlabifyArray(unittest.TestCase):
     def setUp(self):
         self.array = np.array([1., 2., 3.])
@@ -106,6 +648,16 @@ class Test_matlabifyArray(unittest.TestCase):
         self.assertEqual(e['Capture2'], np.array(['two']))
         self.assertEqual(e['Capture1'], np.array([[1]]))
         np.testing.assert_array_equal(e['GridSize'], np.array([[1., 2., 3.]]))
+
+    def test_matlabify_array_float32(self):
+        oommfdecode.matlabifyArray(self.array.astype(np.float32), self.headers, self.extraCaptures, self.filename)
+        e = spio.loadmat(self.filename)
+        self.assertEqual(e['OOMMFData'].dtype, np.float32)
+
+    def test_matlabify_array_dtype(self):
+        oommfdecode.matlabifyArray(self.array, self.headers, self.extraCaptures, self.filename, dtype=np.float32)
+        e = spio.loadmat(self.filename)
+        self.assertEqual(e['OOMMFData'].dtype, np.float32)
         
 class Test_textDecode(unittest.TestCase):
     def setUp(self):
@@ -156,6 +708,25 @@ class Test_textDecode(unittest.TestCase):
         #self.assertEqual(targetarray.all(), np.array(1))
         np.testing.assert_array_equal(targetarray, self.test_array)
 
+    def test_textDecode_stops_at_end_marker(self):
+        output = io.StringIO(u'-0.80  0.52  0.00\n-0.35  0.27  0.00\n-0.21  0.17  0.00\n# End: Data Text\n# End: Segment\n')
+        oommfdecode._textDecode(output, self.outArray, self.headers, self.extraCaptures)
+        self.assertEqual(output.readline(), u'# End: Data Text\n')
+
+    def test_textDecode_truncated(self):
+        output = io.StringIO(u'-0.80  0.52  0.00\n-0.35  0.27  0.00\n# End: Data Text\n')
+        with self.assertRaises(Exception):
+            oommfdecode._textDecode(output, self.outArray, self.headers, self.extraCaptures)
+
+    def test_textDecode_chunked(self):
+        chunk_lines = oommfdecode.TEXT_CHUNK_LINES
+        oommfdecode.TEXT_CHUNK_LINES = 2
+        try:
+            (targetarray, headers, extraCaptures) = oommfdecode._textDecode(self.output, self.outArray, self.headers, self.extraCaptures)
+        finally:
+            oommfdecode.TEXT_CHUNK_LINES = chunk_lines
+        np.testing.assert_array_equal(targetarray, self.test_array)
+
 class Test_binaryDecode(unittest.TestCase):
     def setUp(self):
         self.outArray = np.zeros((3, 3, 3, 3))
@@ -244,6 +815,17 @@ class Test_binaryDecode(unittest.TestCase):
                                   headers=self.headers, 
                                   extraCaptures=self.extraCaptures)
         np.testing.assert_allclose(targetarray,2.0*self.test_array)        
+
+    def test_binaryDecode_truncated(self):
+        output_short = io.BytesIO(struct.pack('<%sd' % (self.test_array.size - 1), *self.test_array.flatten('C')[:-1]))
+        with self.assertRaises(Exception):
+            oommfdecode._binaryDecode(output_short,
+                                      self.chunksize_8,
+                                      struct.Struct("<d"),
+                                      self.outArray,
+                                      self.headers,
+                                      self.extraCaptures)
+
 class Test_slowlyPainfullyMaximise(unittest.TestCase):
     def setUp(self):
         self.test_files_folder = 'testfiles'
@@ -263,6 +845,65 @@ class Test_slowlyPainfullyMaximise(unittest.TestCase):
         max_mag = oommfdecode.slowlyPainfullyMaximize([self.vector_file_text, self.vector_file_binary])
         np.testing.assert_almost_equal(max_mag, 349370.681891435)
 
+    def test_slowlyPainfullyMaximize_force_scan_single_file(self):
+        max_mag = oommfdecode.slowlyPainfullyMaximize([self.vector_file_text], forceScan=True)
+        self.assertEqual(max_mag, 258967.81743932364)
+
+    def test_slowlyPainfullyMaximize_force_scan_multifile(self):
+        max_mag = oommfdecode.slowlyPainfullyMaximize([self.vector_file_text, self.vector_file_binary], forceScan=True)
+        self.assertEqual(max_mag, 349370.681891435)
+
+    def test_slowlyPainfullyMaximize_no_header_range(self):
+        with open(self.vector_file_binary, 'rb') as f:
+            content = f.read().replace(b'# ValueRangeMaxMag: 349370.68189143512\n', b'')
+        filename = os.path.join(tempfile.gettempdir(), 'test_no_range.ohf')
+        with open(filename, 'wb') as f:
+            f.write(content)
+        max_mag = oommfdecode.slowlyPainfullyMaximize([filename])
+        self.assertEqual(max_mag, 349370.681891435)
+
+    def test_maxMagnitude(self):
+        array = np.array([[[[3., 4., 0.], [0., 0., 1.]]]])
+        self.assertEqual(oommfdecode.maxMagnitude(array), 5.0)
+
+
+class Test_orderByHeaders(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        with open(os.path.join(TEST_DIR, 'testfiles', 'h2h_leftedge_40x4.ohf'), 'rb') as f:
+            self.source = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write_frame(self, name, simtime, stage=0):
+        data = self.source.replace(b'# Desc: Total simulation time: 0 s',
+                                   b'# Desc: Total simulation time: ' + simtime.encode() + b' s')
+        data = data.replace(b'# Desc: Stage: 0,', b'# Desc: Stage: ' + str(stage).encode() + b',')
+        path = os.path.join(self.work_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_orderByHeaders_simtime(self):
+        late = self.write_frame('a.ohf', '2e-9')
+        early = self.write_frame('b.ohf', '1e-9')
+        self.assertEqual(oommfdecode.orderByHeaders([late, early]), [early, late])
+
+    def test_orderByHeaders_stage_then_filename(self):
+        second = self.write_frame('a.ohf', '1e-9', stage=2)
+        first = self.write_frame('b.ohf', '1e-9', stage=1)
+        tied = self.write_frame('c.ohf', '1e-9', stage=1)
+        self.assertEqual(oommfdecode.orderByHeaders([tied, second, first]),
+                         [first, tied, second])
+
+    def test_orderByHeaders_groupUnpack(self):
+        late = self.write_frame('a.ohf', '2e-9')
+        early = self.write_frame('b.ohf', '1e-9')
+        ordered = oommfdecode.orderByHeaders([late, early])
+        (arrays, headers, extraData) = oommfdecode.groupUnpack(ordered)
+        self.assertEqual(extraData['SimTime'], [1e-9, 2e-9])
+
 
 class Test_sortBySimTime(unittest.TestCase):
 
@@ -0,0 +1,135 @@
+import sys, os
+import shutil
+import tempfile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+sys.path.insert(0, PROJECT_DIR)
+
+import unittest
+import numpy as np
+import oommftools.core.oommfdecode as oommfdecode
+import oommftools.core.ovfcompact as ovfcompact
+
+
+class Test_compactFiles(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.test_files_folder = os.path.join(TEST_DIR, 'testfiles')
+        self.archive = os.path.join(self.work_dir, 'archive')
+        os.makedirs(os.path.join(self.archive, 'run'))
+        self.text_file = os.path.join(self.archive, 'run', 'dw_edgefield_cut_cell4_160.ohf')
+        self.binary_file = os.path.join(self.archive, 'h2h_leftedge_40x4.ohf')
+        shutil.copy(os.path.join(self.test_files_folder, 'dw_edgefield_cut_cell4_160.ohf'),
+                    self.text_file)
+        shutil.copy(os.path.join(self.test_files_folder, 'h2h_leftedge_40x4.ohf'),
+                    self.binary_file)
+        self.expected = oommfdecode.unpackFile(self.text_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_compact_in_place(self):
+        size = os.path.getsize(self.text_file)
+        compacted, errors = ovfcompact.compactFiles([self.text_file, self.binary_file])
+        self.assertEqual(compacted, [self.text_file])
+        self.assertEqual(errors, {})
+        self.assertLess(os.path.getsize(self.text_file), size)
+        self.assertEqual(oommfdecode.scanHeaders(self.text_file)['DataFormat'], 'Binary 8')
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.text_file)
+        np.testing.assert_array_equal(array, self.expected[0])
+        self.assertEqual(extraCaptures, self.expected[2])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.archive, 'run'))),
+                         ['dw_edgefield_cut_cell4_160.ohf'])
+
+    def test_compact_mirror(self):
+        mirror = os.path.join(self.work_dir, 'mirror')
+        ovfcompact.compactFiles([self.text_file, self.binary_file], mirror, dataFormat="Binary 4")
+        self.assertEqual(oommfdecode.scanHeaders(self.text_file)['DataFormat'], 'Text')
+        copy = os.path.join(mirror, 'run', 'dw_edgefield_cut_cell4_160.ohf')
+        self.assertEqual(oommfdecode.scanHeaders(copy)['DataFormat'], 'Binary 4')
+        np.testing.assert_array_equal(oommfdecode.unpackFile(copy)[0],
+                                      self.expected[0].astype(np.float32))
+        self.assertTrue(os.path.exists(os.path.join(mirror, 'h2h_leftedge_40x4.ohf')))
+
+    def test_compact_ovf2(self):
+        (array, headers, extraCaptures) = self.expected
+        fields = dict(headers)
+        fields.update(extraCaptures)
+        scalar = os.path.join(self.archive, 'scalar.oef')
+        vector = os.path.join(self.archive, 'vector.ohf')
+        oommfdecode.writeOVF(scalar, array[..., :1], fields, "Text", version=2)
+        oommfdecode.writeOVF(vector, array, fields, "Text", version=2)
+        compacted, errors = ovfcompact.compactFiles([scalar, vector])
+        self.assertEqual(compacted, [scalar, vector])
+        for target, expected in ((scalar, array[..., :1]), (vector, array)):
+            fields = oommfdecode.scanHeaders(target)
+            self.assertEqual(fields['DataFormat'], 'Binary 8')
+            self.assertEqual(fields['valuedim'], expected.shape[-1])
+            np.testing.assert_array_equal(oommfdecode.unpackFile(target)[0], expected)
+
+    def test_compact_keeps_going(self):
+        broken = os.path.join(self.archive, 'broken.ohf')
+        with open(broken, 'wb') as f:
+            f.write(b'# OOMMF: rectangular mesh v1.0\n# Segment count: 1\n')
+        compacted, errors = ovfcompact.compactFiles([broken, self.text_file])
+        self.assertEqual(compacted, [self.text_file])
+        self.assertEqual(list(errors.keys()), [broken])
+
+    def test_main(self):
+        ovfcompact.main([self.archive])
+        self.assertEqual(oommfdecode.scanHeaders(self.text_file)['DataFormat'], 'Binary 8')
+
+
+class Test_writeOVF(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work_dir, 'out.ovf')
+        self.vector_file_binary = os.path.join(TEST_DIR, 'testfiles', 'h2h_leftedge_40x4.ohf')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_writeOVF_round_trip(self):
+        (array, headers, extraCaptures) = oommfdecode.unpackFile(self.vector_file_binary)
+        fields = dict(headers)
+        fields.update(extraCaptures)
+        for version in (1, 2):
+            for dataFormat in ("Binary 8", "Text"):
+                oommfdecode.writeOVF(self.filename, array, fields, dataFormat, version)
+                (written, writtenHeaders, writtenExtra) = oommfdecode.unpackFile(self.filename)
+                np.testing.assert_array_equal(written, array)
+                self.assertEqual(writtenExtra, extraCaptures)
+
+    def test_writeOVF_byte_order(self):
+        array = np.ones((2, 1, 1, 3))
+        fields = {'xbase': 0, 'ybase': 0, 'zbase': 0,
+                  'xstepsize': 1, 'ystepsize': 1, 'zstepsize': 1}
+        oommfdecode.writeOVF(self.filename, array, fields, "Binary 4", version=2)
+        fields = oommfdecode.scanHeaders(self.filename)
+        self.assertEqual(fields['valuedim'], 3.0)
+        with open(self.filename, 'rb') as f:
+            f.seek(fields['DataOffset'])
+            self.assertEqual(np.frombuffer(f.read(4), dtype='<f4')[0], 1234567.0)
+
+    def test_writeOVF_bounds(self):
+        array = np.ones((4, 2, 1, 3))
+        fields = {'xbase': 0.5, 'ybase': 1.0, 'zbase': 0,
+                  'xstepsize': 1, 'ystepsize': 2, 'zstepsize': 4}
+        oommfdecode.writeOVF(self.filename, array, fields)
+        written = oommfdecode.scanHeaders(self.filename)
+        for key, value in (('xmin', 0.0), ('ymin', 0.0), ('zmin', -2.0),
+                           ('xmax', 4.0), ('ymax', 4.0), ('zmax', 2.0)):
+            self.assertEqual(written[key], value)
+        oommfdecode.writeOVF(self.filename, array, dict(fields, xmin=-1.0))
+        self.assertEqual(oommfdecode.scanHeaders(self.filename)['xmin'], -1.0)
+
+    def test_writeOVF_bad_format(self):
+        array = np.ones((2, 1, 1, 3))
+        fields = {'xbase': 0, 'ybase': 0, 'zbase': 0,
+                  'xstepsize': 1, 'ystepsize': 1, 'zstepsize': 1}
+        with self.assertRaises(Exception):
+            oommfdecode.writeOVF(self.filename, array, fields, "Binary 2")
+        self.assertFalse(os.path.exists(self.filename))
+        with self.assertRaises(Exception):
+            oommfdecode.writeOVF(self.filename, np.ones((2, 1, 1, 1)), fields)